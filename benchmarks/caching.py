@@ -0,0 +1,34 @@
+from time import perf_counter
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from benchmarks.synthetic import write_experiments
+from utilities.result import load_results
+
+CONFIGS = 16
+QUERIES = 40
+RESULTS = 20000
+REPETITIONS = 3
+
+
+def measure(path: Path, cache: bool) -> float:
+    start = perf_counter()
+    load_results(path, cache=cache)
+    return perf_counter() - start
+
+
+def main() -> None:
+    with TemporaryDirectory() as temporary:
+        path = Path(temporary)
+        write_experiments(path, configs=CONFIGS, queries=QUERIES, results=RESULTS)
+        uncached = min(measure(path, cache=False) for _ in range(REPETITIONS))
+        cold = measure(path, cache=True)
+        warm = min(measure(path, cache=True) for _ in range(REPETITIONS))
+        print(f"{'load':8s}\t{'time [s]':>8s}")
+        print(f"{'no cache':8s}\t{uncached:8.3f}")
+        print(f"{'cold':8s}\t{cold:8.3f}")
+        print(f"{'warm':8s}\t{warm:8.3f}\t{uncached / warm:.1f}x faster than no cache")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+from time import perf_counter
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from benchmarks.synthetic import write_pods
+from scripts.solidbench import get_all_index_metrics, get_all_pod_metrics
+from utilities.quadindex import open_index, update_index
+
+PODS = 10
+FILES = 20
+STATEMENTS = 2000
+
+
+def main() -> None:
+    with TemporaryDirectory() as temporary:
+        pods = Path(temporary).joinpath("pods")
+        index = Path(temporary).joinpath("index.db")
+        write_pods(pods, PODS, FILES, STATEMENTS)
+        print(
+            f"Calculating metrics for {PODS * FILES} files of {STATEMENTS} statements"
+        )
+
+        start = perf_counter()
+        files = get_all_pod_metrics(pods, set((".nq",)), 1, 0.01, True, 20)
+        print(f"{'files':9s}\t{perf_counter() - start:8.2f} s")
+
+        for mode in ("build", "update"):
+            start = perf_counter()
+            connection = open_index(index)
+            update_index(connection, pods, set((".nq",)))
+            connection.close()
+            print(f"{mode:9s}\t{perf_counter() - start:8.2f} s")
+
+        start = perf_counter()
+        indexed = get_all_index_metrics(pods, index, 20)
+        print(f"{'index':9s}\t{perf_counter() - start:8.2f} s")
+
+        assert files == indexed, "The metrics differ"
+
+
+if __name__ == "__main__":
+    main()
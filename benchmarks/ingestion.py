@@ -0,0 +1,70 @@
+from sys import executable
+from json import dump
+from time import perf_counter
+from random import Random
+from pathlib import Path
+from subprocess import run
+from tempfile import TemporaryDirectory
+from typing import Tuple
+
+ROOT = Path(__file__).parent.parent
+RESULTS = 500000
+
+# the child reports its peak resident set size in kilobytes after reading the file
+READER = (
+    "from resource import getrusage, RUSAGE_SELF; from pathlib import Path; "
+    "from scripts.process import read_result_file, read_result_file_streaming; "
+    "{function}(Path({path!r})); print(getrusage(RUSAGE_SELF).ru_maxrss)"
+)
+
+
+def write_result_file(path: Path) -> None:
+    random = Random(0)
+    timestamps = sorted(random.sample(range(1, 10**12), RESULTS))
+    bindings = {
+        "person": "http://localhost:3000/pods/00000000000000000933/profile/card#me",
+        "message": "http://localhost:3000/pods/00000000000000000933/posts/2010-10-13",
+    }
+    data = {
+        "engine_query": "/queries/interactive-discover-1.sparql#0",
+        "time_taken_seconds": 12.5,
+        "result_count": RESULTS,
+        "requested_urls_count": 1000,
+        "engine_timeout_reached": False,
+        "result_data": {str(t): bindings for t in timestamps},
+        "result_data_other": [],
+    }
+    with open(path, "w") as result_file:
+        dump(data, result_file)
+
+
+def measure(function: str, path: Path) -> Tuple[float, int]:
+    start = perf_counter()
+    process = run(
+        [executable, "-c", READER.format(function=function, path=path.as_posix())],
+        cwd=ROOT,
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    return perf_counter() - start, int(process.stdout.strip())
+
+
+def main() -> None:
+    with TemporaryDirectory() as temporary:
+        path = Path(temporary).joinpath("result.json")
+        write_result_file(path)
+        size = path.stat().st_size // 1024 // 1024
+        print(f"Reading a {size} MiB runner output file with {RESULTS} results")
+        print(f"{'mode':9s}\t{'time [s]':>8s}\t{'peak rss [MiB]':>14s}")
+        for mode, function in (
+            ("full", "read_result_file"),
+            ("streaming", "read_result_file_streaming"),
+            ("imports", "bool"),
+        ):
+            duration, rss = measure(function, path)
+            print(f"{mode:9s}\t{duration:8.2f}\t{rss / 1024:14.1f}")
+
+
+if __name__ == "__main__":
+    main()
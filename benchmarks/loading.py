@@ -0,0 +1,31 @@
+from os import cpu_count
+from time import perf_counter
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from benchmarks.synthetic import write_experiments
+from utilities.result import load_results
+
+CONFIGS = 48
+QUERIES = 40
+RESULTS = 5000
+
+
+def main() -> None:
+    with TemporaryDirectory() as temporary:
+        path = Path(temporary)
+        write_experiments(path, configs=CONFIGS, queries=QUERIES, results=RESULTS)
+        worker_counts = sorted(set((1, 2, 4, 8, 16, 32, cpu_count())))
+        print(f"Loading {CONFIGS} configs with {cpu_count()} cores available")
+        print(f"{'workers':>8s}\t{'time [s]':>8s}\tspeedup")
+        serial = None
+        for workers in (w for w in worker_counts if w <= cpu_count()):
+            start = perf_counter()
+            load_results(path, workers=workers, cache=False)
+            duration = perf_counter() - start
+            serial = serial or duration
+            print(f"{workers:8d}\t{duration:8.2f}\t{serial / duration:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
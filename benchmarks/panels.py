@@ -0,0 +1,51 @@
+from time import perf_counter
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from benchmarks.synthetic import write_experiments
+from scripts.timestamps import (
+    PANEL_CACHE_NAME,
+    get_colors,
+    plot_cached_timestamps,
+    plot_timestamps,
+)
+from utilities.result import group_by_query, load_results
+
+CONFIGS = 8
+QUERIES = 5
+RESULTS = 5000
+DPI = 100
+REPETITIONS = 3
+
+
+def measure(path: Path, cache: bool) -> float:
+    table = load_results(path)
+    results = group_by_query(table)
+    colors = get_colors(sorted(set(r.experiment for r in table)), "Spectral")
+    output = path.joinpath("timestamps.png")
+    start = perf_counter()
+    if cache:
+        fig = plot_cached_timestamps(
+            results, False, colors, DPI, False, path.joinpath(PANEL_CACHE_NAME)
+        )
+    else:
+        fig = plot_timestamps(results, False, colors, DPI)
+    fig.savefig(output)
+    return perf_counter() - start
+
+
+def main() -> None:
+    with TemporaryDirectory() as temporary:
+        path = Path(temporary)
+        write_experiments(path, configs=CONFIGS, queries=QUERIES, results=RESULTS)
+        uncached = min(measure(path, cache=False) for _ in range(REPETITIONS))
+        cold = measure(path, cache=True)
+        warm = min(measure(path, cache=True) for _ in range(REPETITIONS))
+        print(f"{'plot':8s}\t{'time [s]':>8s}")
+        print(f"{'no cache':8s}\t{uncached:8.3f}")
+        print(f"{'cold':8s}\t{cold:8.3f}")
+        print(f"{'warm':8s}\t{warm:8.3f}\t{uncached / warm:.1f}x faster than no cache")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+from io import StringIO
+from csv import DictReader, field_size_limit
+from time import perf_counter
+from random import Random
+from typing import Callable
+
+from benchmarks.synthetic import COLUMNS, get_timestamps
+from utilities.result import (
+    ResultTable,
+    parse_timestamps,
+    TIME_DIVISOR,
+    LIST_SEPARATOR,
+    COLUMN_SEPARATOR,
+)
+
+TIMESTAMPS = 1000000
+REPETITIONS = 3
+
+
+def get_row() -> str:
+    timestamps = " ".join(str(t) for t in get_timestamps(Random(0), TIMESTAMPS))
+    values = {c: "0" for c in COLUMNS}
+    values.update(
+        name="interactive-discover-1",
+        error="false",
+        timestamps=timestamps,
+        timestampsMin=timestamps,
+        timestampsMax=timestamps,
+    )
+    return COLUMN_SEPARATOR.join(values[c] for c in COLUMNS)
+
+
+def measure(function: Callable[[], None]) -> float:
+    durations = []
+    for _ in range(REPETITIONS):
+        start = perf_counter()
+        function()
+        durations.append(perf_counter() - start)
+    return min(durations)
+
+
+def main() -> None:
+    row = get_row()
+    field = row.split(COLUMN_SEPARATOR)[COLUMNS.index("timestamps")]
+    header = COLUMN_SEPARATOR.join(COLUMNS)
+    field_size_limit(len(row))
+
+    def previous_field() -> None:
+        sorted(float(t) / TIME_DIVISOR for t in field.split(LIST_SEPARATOR))
+
+    def previous_row() -> None:
+        for values in DictReader(StringIO(f"{header}\n{row}\n"), delimiter=";"):
+            for column in ("timestamps", "timestampsMin", "timestampsMax"):
+                sorted(
+                    float(t) / TIME_DIVISOR
+                    for t in values[column].split(LIST_SEPARATOR)
+                )
+
+    def current_field() -> None:
+        parse_timestamps(field)
+
+    def current_row() -> None:
+        ResultTable.from_rows("", COLUMNS, [row.split(COLUMN_SEPARATOR)])
+
+    print(f"Parsing a synthetic row with {TIMESTAMPS} timestamps per column")
+    print(f"{'parser':8s}\t{'field [s]':>9s}\t{'row [s]':>9s}")
+    previous = (measure(previous_field), measure(previous_row))
+    current = (measure(current_field), measure(current_row))
+    print(f"{'previous':8s}\t{previous[0]:9.3f}\t{previous[1]:9.3f}")
+    print(f"{'current':8s}\t{current[0]:9.3f}\t{current[1]:9.3f}")
+    print(
+        f"{'speedup':8s}\t{previous[0] / current[0]:8.1f}x"
+        f"\t{previous[1] / current[1]:8.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+from time import perf_counter
+from random import Random
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Dict, List
+from rdflib import Graph
+from rdflib.term import URIRef, Variable
+
+from benchmarks.synthetic import write_pods
+from scripts.patterns import PatternIndex, TriplePattern
+
+PATTERNS = 200
+
+
+def get_patterns(random: Random) -> List[TriplePattern]:
+    patterns: List[TriplePattern] = []
+    for _ in range(PATTERNS):
+        predicate = URIRef(f"http://example.org/vocabulary#p{random.randint(0, 40)}")
+        subject = URIRef(
+            f"http://localhost:3000/pods/{0:020d}/posts/{random.randint(0, 500)}"
+        )
+        bound = random.random() < 0.3
+        patterns.append(
+            TriplePattern(subject if bound else Variable("s"), predicate, Variable("o"))
+        )
+    return patterns
+
+
+def main() -> None:
+    with TemporaryDirectory() as temporary:
+        path = Path(temporary)
+        write_pods(path, 1, 10, 2000)
+        data = Graph()
+        for file_path in sorted(path.glob("**/*.nq")):
+            data.parse(file_path)
+        triples = list(data)
+        patterns = get_patterns(Random(0))
+        print(f"Matching {len(triples)} triples against {len(patterns)} patterns")
+
+        start = perf_counter()
+        nested: Dict[int, int] = {}
+        for s, p, o in triples:
+            for index, pattern in enumerate(patterns):
+                if pattern.match(s, p, o):
+                    nested[index] = nested.get(index, 0) + 1
+        print(f"{'nested':9s}\t{perf_counter() - start:8.2f} s")
+
+        start = perf_counter()
+        indexed: Dict[int, int] = {}
+        pattern_index = PatternIndex((p, i) for i, p in enumerate(patterns))
+        for s, p, o in triples:
+            for index in pattern_index.match(s, p, o):
+                indexed[index] = indexed.get(index, 0) + 1
+        print(f"{'indexed':9s}\t{perf_counter() - start:8.2f} s")
+
+        assert nested == indexed, "The matches differ"
+
+
+if __name__ == "__main__":
+    main()
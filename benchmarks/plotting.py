@@ -0,0 +1,45 @@
+from time import perf_counter
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from numpy import arange
+
+import scripts.timestamps
+from benchmarks.synthetic import write_experiments
+from scripts.timestamps import get_colors, plot_timestamps, get_sample_indices
+from utilities.result import group_by_query, load_results
+
+CONFIGS = 3
+QUERIES = 4
+RESULTS = 200000
+DPI = 100
+
+
+def get_all_indices(series, buckets):
+    return arange(len(series[0]))
+
+
+def main() -> None:
+    with TemporaryDirectory() as temporary:
+        path = Path(temporary)
+        write_experiments(path, configs=CONFIGS, queries=QUERIES, results=RESULTS)
+        table = load_results(path, cache=False)
+        results = group_by_query(table)
+        colors = get_colors(sorted(set(r.experiment for r in table)), "Spectral")
+        points = sum(len(r.timestamps) for r in table)
+        print(f"Plotting {len(table)} results with {points} timestamps at {DPI} dpi")
+        print(f"{'mode':12s}\t{'time [s]':>8s}\t{'svg [KiB]':>9s}")
+        for mode, function in (
+            ("full", get_all_indices),
+            ("downsampled", get_sample_indices),
+        ):
+            scripts.timestamps.get_sample_indices = function
+            output = path.joinpath(f"{mode}.svg")
+            start = perf_counter()
+            fig = plot_timestamps(results, False, colors, DPI)
+            fig.savefig(output)
+            duration = perf_counter() - start
+            print(f"{mode:12s}\t{duration:8.2f}\t{output.stat().st_size / 1024:9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+from time import perf_counter
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from benchmarks.synthetic import write_pods
+from utilities.walker import list_files
+from scripts.solidbench import DatasetStatistics
+
+PODS = 10
+FILES = 20
+STATEMENTS = 2000
+COLUMNS = ("distinct_subjects", "distinct_objects", "distinct_predicates")
+
+
+def main() -> None:
+    with TemporaryDirectory() as temporary:
+        path = Path(temporary)
+        write_pods(path, PODS, FILES, STATEMENTS)
+        files = sorted(list_files(path, (".nq",)))
+        print(
+            f"Collecting statistics for {len(files)} files of {STATEMENTS} statements"
+        )
+        metrics = {}
+        for mode, error, exact in (
+            ("exact", 0.01, True),
+            ("sketch 1%", 0.01, False),
+            ("sketch 5%", 0.05, False),
+        ):
+            statistics = DatasetStatistics(error, exact, 20)
+            start = perf_counter()
+            for entry in files:
+                statistics.add_document(Path(entry.path), entry.size)
+            duration = perf_counter() - start
+            metrics[mode] = statistics.to_metrics(20)
+            errors = "\t".join(
+                f"{c} {metrics[mode][c] / metrics['exact'][c] - 1:+.2%}"
+                for c in COLUMNS
+            )
+            print(f"{mode:9s}\t{duration:8.2f} s\t{errors}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+from sys import executable
+from time import perf_counter
+from pathlib import Path
+from statistics import mean, median
+from subprocess import run, DEVNULL
+from typing import List, Dict
+
+ROOT = Path(__file__).parent.parent
+LAUNCHER = "sparql-benchmark-recap.py"
+REPETITIONS = 10
+
+# the previous launcher imported every script module before building the parser
+EAGER_LAUNCHER = (
+    "from importlib import import_module; from os import listdir; import sys, runpy; "
+    "[import_module('scripts.' + f.removesuffix('.py')) "
+    "for f in listdir('scripts') if f.endswith('.py')]; "
+    "sys.argv = [{launcher!r}, *{args!r}]; "
+    "runpy.run_path({launcher!r}, run_name='__main__')"
+)
+
+
+def measure(command: List[str]) -> List[float]:
+    durations: List[float] = []
+    for _ in range(REPETITIONS):
+        start = perf_counter()
+        run(command, cwd=ROOT, stdout=DEVNULL, stderr=DEVNULL, check=True)
+        durations.append(perf_counter() - start)
+    return durations
+
+
+def main() -> None:
+    invocations: Dict[str, List[str]] = {
+        "--help": ["--help"],
+        "filehash --help": ["filehash", "--help"],
+        "diefficiency --help": ["diefficiency", "--help"],
+    }
+    print(f"{'invocation':24s}\t{'eager [ms]':>10s}\t{'lazy [ms]':>10s}\tspeedup")
+    for name, args in invocations.items():
+        eager = measure(
+            [executable, "-c", EAGER_LAUNCHER.format(launcher=LAUNCHER, args=args)]
+        )
+        lazy = measure([executable, LAUNCHER, *args])
+        print(
+            f"{name:24s}\t{median(eager) * 1000:10.1f}\t{median(lazy) * 1000:10.1f}"
+            f"\t{mean(eager) / mean(lazy):.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
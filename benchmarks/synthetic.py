@@ -0,0 +1,103 @@
+from random import Random
+from pathlib import Path
+from typing import List
+
+COLUMNS: List[str] = [
+    "name",
+    "id",
+    "error",
+    "time",
+    "timeMin",
+    "timeMax",
+    "timeout",
+    "results",
+    "resultsMin",
+    "resultsMax",
+    "timestamps",
+    "timestampsMin",
+    "timestampsMax",
+    "httpRequests",
+    "httpRequestsMin",
+    "httpRequestsMax",
+    "restarts",
+    "restartsMin",
+    "restartsMax",
+]
+
+
+def get_timestamps(random: Random, count: int) -> List[int]:
+    return sorted(random.randint(1, 600000) for _ in range(count))
+
+
+def write_query_times(path: Path, queries: int, results: int, seed: int = 0) -> None:
+    # write a query-times.csv like scripts/process.py does
+    random = Random(seed)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as csv_file:
+        csv_file.write(";".join(COLUMNS) + "\n")
+        for query in range(0, queries):
+            timestamps = get_timestamps(random, random.randint(0, results))
+            time = (timestamps[-1] if timestamps else 0) + random.randint(1, 1000)
+            row = {
+                "name": f"interactive-discover-{query // 5 + 1}",
+                "id": str(query % 5),
+                "error": "false" if timestamps else "true",
+                "time": time,
+                "timeMin": time,
+                "timeMax": time,
+                "timeout": "false",
+                "results": len(timestamps),
+                "resultsMin": len(timestamps),
+                "resultsMax": len(timestamps),
+                "timestamps": " ".join(str(t) for t in timestamps),
+                "timestampsMin": " ".join(str(max(t - 10, 0)) for t in timestamps),
+                "timestampsMax": " ".join(str(t + 10) for t in timestamps),
+                "httpRequests": random.randint(1, 1000),
+                "httpRequestsMin": 0,
+                "httpRequestsMax": 1000,
+                "restarts": 0,
+                "restartsMin": 0,
+                "restartsMax": 0,
+            }
+            csv_file.write(";".join(str(row[k]) for k in COLUMNS) + "\n")
+
+
+def write_experiments(path: Path, configs: int, queries: int, results: int) -> None:
+    # write a result root with one experiment per config
+    for config in range(0, configs):
+        write_query_times(
+            path.joinpath(f"config-{config}", "output", "query-times.csv"),
+            queries=queries,
+            results=results,
+            seed=config,
+        )
+
+
+def get_term(random: Random, pod: str) -> str:
+    kind = random.random()
+    if kind < 0.6:
+        return f"<{pod}/posts/{random.randint(0, 500)}#{random.randint(0, 9)}>"
+    if kind < 0.8:
+        return f'"some text with \\"quotes\\", spaces # and {random.randint(0, 99)}"'
+    if kind < 0.9:
+        return f'"{random.randint(0, 10**6)}"^^<http://www.w3.org/2001/XMLSchema#long>'
+    return f"_:b{random.randint(0, 50)}"
+
+
+def write_pods(path: Path, pods: int, files: int, statements: int) -> None:
+    # write solidbench-like pods with comments, duplicates and named graphs
+    random = Random(0)
+    for index in range(pods):
+        pod = f"http://localhost:3000/pods/{index:020d}"
+        for document in range(files):
+            file_path = path.joinpath(f"{index:020d}", "posts", f"{document}.nq")
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            lines: List[str] = ["# generated", ""]
+            for _ in range(statements):
+                subject = f"<{pod}/posts/{random.randint(0, 500)}>"
+                predicate = f"<http://example.org/vocabulary#p{random.randint(0, 20)}>"
+                graph = f" <{pod}/graph>" if random.random() < 0.1 else ""
+                lines.append(f"{subject} {predicate} {get_term(random, pod)}{graph} .")
+            lines.extend(random.sample(lines[2:], statements // 20))
+            with open(file_path, "w") as document_file:
+                document_file.write("\n".join(lines) + "\n")
@@ -0,0 +1,39 @@
+from time import perf_counter
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from rdflib import Graph
+
+from benchmarks.synthetic import write_pods
+from utilities.nquads import count_triples
+
+PODS = 10
+FILES = 20
+STATEMENTS = 2000
+
+
+def count_with_rdflib(path: Path) -> int:
+    data = Graph()
+    data.parse(path)
+    return len(data)
+
+
+def main() -> None:
+    with TemporaryDirectory() as temporary:
+        path = Path(temporary)
+        write_pods(path, PODS, FILES, STATEMENTS)
+        files = sorted(path.glob("**/*.nq"))
+        print(f"Counting triples in {len(files)} files of {STATEMENTS} statements")
+        counts = {}
+        for mode, function in (
+            ("rdflib", count_with_rdflib),
+            ("streaming", count_triples),
+        ):
+            start = perf_counter()
+            counts[mode] = [function(p) for p in files]
+            duration = perf_counter() - start
+            print(f"{mode:9s}\t{duration:8.2f} s\t{sum(counts[mode])} triples")
+        assert counts["rdflib"] == counts["streaming"], "The triple counts differ"
+
+
+if __name__ == "__main__":
+    main()
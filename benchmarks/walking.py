@@ -0,0 +1,50 @@
+from time import perf_counter
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import List
+
+from utilities.walker import list_files
+
+DIRECTORIES = 200
+FILES = 250
+
+
+def write_tree(path: Path) -> None:
+    for directory in range(DIRECTORIES):
+        directory_path = path.joinpath(f"{directory // 20}", f"{directory}")
+        directory_path.mkdir(parents=True)
+        for file in range(FILES):
+            name = f"{file}.nq" if file % 5 else f"{file}.meta"
+            directory_path.joinpath(name).write_bytes(b"x" * file)
+
+
+def walk_iterdir(path: Path) -> List[Path]:
+    # the earlier walk, with separate stat calls for the type and the size
+    files: List[Path] = []
+    path_queue = set(path.iterdir())
+    while path_queue:
+        file_path = path_queue.pop()
+        if file_path.is_dir():
+            path_queue.update(file_path.iterdir())
+        elif file_path.is_file() and file_path.name.endswith(".nq"):
+            file_path.stat()
+            files.append(file_path)
+    return files
+
+
+def main() -> None:
+    with TemporaryDirectory() as temporary:
+        path = Path(temporary)
+        write_tree(path)
+        print(f"Walking {DIRECTORIES} directories with {FILES} files each")
+        for mode, function in (
+            ("iterdir", walk_iterdir),
+            ("scandir", lambda p: list_files(p, (".nq",))),
+        ):
+            start = perf_counter()
+            count = len(function(path))
+            print(f"{mode:9s}\t{perf_counter() - start:8.2f} s\t{count} files")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,21 @@
 from csv import DictWriter
 from argparse import ArgumentParser
-from typing import Dict, List
+from typing import Dict, List, Tuple
+from os import cpu_count
 from pathlib import Path
 from logging import info
+from math import isnan
+from numpy import ndarray
 
 from utilities.result import load_results
 from utilities.sorting import natural_sort_key
+from utilities.diefficiency import dief_at_k, dief_at_t
 
 
 def register_args(parser: ArgumentParser) -> None:
     parser.description = (
-        "Calculate diefficiency at k "
-        "when k is set to the total number of expected results"
+        "Calculate diefficiency at k when k is set to the total number of "
+        "expected results, or at the chosen answer counts k or times t"
     )
     parser.add_argument(
         "--experiments",
@@ -39,15 +43,39 @@ def register_args(parser: ArgumentParser) -> None:
     parser.add_argument(
         "--linear",
         help="Whether to use linear interpolation for answer distribution",
-        default=False,
+        action="store_true",
+    )
+    parser.add_argument(
+        "--k",
+        help="Calculate dief@k at the chosen answer counts instead",
+        nargs="+",
+        type=int,
+    )
+    parser.add_argument(
+        "--t",
+        help="Calculate dief@t at the chosen times in seconds instead",
+        nargs="+",
+        type=float,
+    )
+    parser.add_argument(
+        "--workers",
+        help="Number of processes to load the experiments with",
+        default=cpu_count(),
+        type=int,
+    )
+    parser.add_argument(
+        "--no-cache",
+        help="Parse the result files without using or updating the cache",
+        dest="cache",
+        action="store_false",
     )
 
 
 def relative_to_baseline(
-    results: Dict[str, Dict[str, float | None]],
+    results: Dict[Tuple[str, str], Dict[str, float | None]],
     baseline: str,
-) -> Dict[str, Dict[str, float | None]]:
-    relative_results: Dict[str, Dict[str, float | None]] = {}
+) -> Dict[Tuple[str, str], Dict[str, float | None]]:
+    relative_results: Dict[Tuple[str, str], Dict[str, float | None]] = {}
     for query, query_results in results.items():
         relative_query_results = {}
         for config, diefficiency in query_results.items():
@@ -65,27 +93,51 @@ def run_script(
     output: Path,
     delimiter: str,
     linear: bool,
+    workers: int,
+    cache: bool,
     baseline: str | None = None,
+    k: List[int] | None = None,
+    t: List[float] | None = None,
 ) -> None:
 
     info(f"Calculating diefficiency for output in {experiments.absolute()}")
 
+    table = load_results(experiments, workers=workers, cache=cache)
+    timestamps = table.columns["timestamps"]
+    offsets = table.offsets("timestamps")
+
+    # the values of each metric are calculated for all results at once
+    metrics: Dict[str, ndarray] = {}
+    if not k and not t:
+        metrics[""] = dief_at_k(timestamps, offsets, linear=linear)
+    for k_value in k or []:
+        metrics[f"dief@k={k_value}"] = dief_at_k(timestamps, offsets, k_value, linear)
+    for t_value in t or []:
+        metrics[f"dief@t={t_value}"] = dief_at_t(timestamps, offsets, t_value, linear)
+
     configs: List[str] = []
     queries: List[str] = []
 
-    results: Dict[str, Dict[str, float | None]] = {}
+    results: Dict[Tuple[str, str], Dict[str, float | None]] = {}
 
-    for result in load_results(experiments):
-        query = result.query()
-        if query not in results:
-            results[query] = {}
-        results[query][result.experiment] = (
-            result.diefficiency(linear=linear) if not result.error else None
-        )
-        if query not in queries:
-            queries.append(query)
-        if result.experiment not in configs:
-            configs.append(result.experiment)
+    for metric, values in metrics.items():
+        for experiment, name, id, error, value in zip(
+            table.columns["experiment"].tolist(),
+            table.columns["name"].tolist(),
+            table.columns["id"].tolist(),
+            table.columns["error"].tolist(),
+            values.tolist(),
+        ):
+            query = f"{name}-{id}"
+            if (query, metric) not in results:
+                results[(query, metric)] = {}
+            results[(query, metric)][experiment] = (
+                value if not error and not isnan(value) else None
+            )
+            if query not in queries:
+                queries.append(query)
+            if experiment not in configs:
+                configs.append(experiment)
 
     # if baseline is selected, convert all results to be relative to that one
     if baseline:
@@ -94,11 +146,18 @@ def run_script(
     configs.sort(key=natural_sort_key)
     queries.sort(key=natural_sort_key)
     configs.insert(0, "query")
+    if k or t:
+        configs.insert(1, "metric")
 
     with open(output, "w") as output_file:
         writer = DictWriter(output_file, fieldnames=configs, delimiter=delimiter)
         writer.writeheader()
-        for query, experiment_results in results.items():
-            writer.writerow({"query": query, **experiment_results})
+        for (query, metric), experiment_results in results.items():
+            if metric:
+                writer.writerow(
+                    {"query": query, "metric": metric, **experiment_results}
+                )
+            else:
+                writer.writerow({"query": query, **experiment_results})
 
     info(f"Wrote diefficiency to {output.absolute()}")
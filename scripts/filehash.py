@@ -1,13 +1,22 @@
-from typing import List, Dict
-from logging import info, warn
+from os import cpu_count
+from typing import List, Dict, Tuple, Any, Callable
+from logging import info, warning
 from pathlib import Path
-from hashlib import md5
-from json import dump
+from hashlib import algorithms_guaranteed, new as new_hash
+from json import dump, load
+from functools import partial
 from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from utilities.hashing import get_file_hash
+from utilities.walker import list_files
+
+# the variable-length shake algorithms cannot produce a digest without a length
+ALGORITHMS: List[str] = sorted(a for a in algorithms_guaranteed if "shake" not in a)
 
 
 def register_args(parser: ArgumentParser) -> None:
-    parser.description = "Calculate metrics about a SolidBench RDF dataset on disk"
+    parser.description = "Calculate file hashes, or verify files against earlier hashes"
     parser.add_argument(
         "--path",
         help="Path to the directory or file to calculate hashes for",
@@ -20,30 +29,314 @@ def register_args(parser: ArgumentParser) -> None:
         required=True,
         type=Path,
     )
+    parser.add_argument(
+        "--algorithm",
+        help="The hash algorithm to use",
+        choices=ALGORITHMS,
+        default="md5",
+    )
+    parser.add_argument(
+        "--workers",
+        help="Number of threads to read and hash files with",
+        default=cpu_count(),
+        type=int,
+    )
+    parser.add_argument(
+        "--incremental",
+        help="Reuse hashes from the existing output for unchanged size and mtime",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--verify",
+        help="Verify the files against this existing output and report differences",
+        type=Path,
+    )
+    parser.add_argument(
+        "--fail-fast",
+        help="Stop verifying at the first difference",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--duplicates",
+        help="Report clusters of byte-identical files instead of all hashes",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--partial-size",
+        help="Bytes from the start and end of files to compare before full hashing",
+        default=4096,
+        type=int,
+    )
 
 
-def run_script(path: Path, output: Path) -> None:
-    info(f"Calculating file hashes for {path}")
+def get_root(path: Path) -> Path:
+    # the files are keyed by their path relative to this, so that the outputs of
+    # the same dataset in different locations can be compared
+    return path.absolute() if path.is_dir() else path.absolute().parent
 
-    hashes: Dict[str, str] = {}
-    queue: List[Path] = list(path.iterdir()) if path.is_dir() else [path]
 
-    while queue:
-        path = queue.pop(0)
-        if path.is_file():
-            with path.open("rb") as fp:
-                hashes[path.absolute().as_posix()] = md5(
-                    fp.read(), usedforsecurity=False
-                ).hexdigest()
-        elif path.is_dir():
-            for fp in path.iterdir():
-                queue.append(fp)
-        else:
-            warn(f"Skipping {path}")
+def get_files(path: Path) -> Dict[str, Dict[str, int]]:
+    if path.is_file():
+        stats = path.stat()
+        return {path.name: {"size": stats.st_size, "mtime": stats.st_mtime_ns}}
+    prefix = len(get_root(path).as_posix().rstrip("/")) + 1
+    return dict(
+        (entry.path[prefix:], {"size": entry.size, "mtime": entry.mtime})
+        for entry in list_files(get_root(path))
+    )
+
+
+def get_relative_files(
+    files: Dict[str, Dict[str, Any]], root: Path
+) -> Dict[str, Dict[str, Any]]:
+    # the earlier outputs were keyed by absolute paths, which are made relative
+    relative_files: Dict[str, Dict[str, Any]] = {}
+    for file_path, entry in files.items():
+        if Path(file_path).is_absolute():
+            try:
+                file_path = Path(file_path).relative_to(root).as_posix()
+            except ValueError:
+                pass
+        relative_files[file_path] = entry
+    return relative_files
+
+
+def load_previous(
+    output: Path, algorithm: str, root: Path
+) -> Dict[str, Dict[str, Any]]:
+    if not output.is_file():
+        return {}
+    with output.open("r", encoding="utf-8") as fp:
+        previous: Dict[str, Any] = load(fp)
+    if previous.get("algorithm") != algorithm or "files" not in previous:
+        info(f"Not reusing hashes from {output} with a different algorithm or format")
+        return {}
+    return get_relative_files(previous["files"], root)
 
-    info(f"Dumping hashes to {output}")
 
+def dump_output(obj: Dict[str, Any], output: Path) -> None:
     with output.open("w", encoding="utf-8") as fp:
-        dump(obj=hashes, fp=fp, sort_keys=True, ensure_ascii=False, indent=2)
+        dump(obj=obj, fp=fp, sort_keys=True, ensure_ascii=False, indent=2)
 
+
+def hash_tree(
+    path: Path,
+    output: Path,
+    algorithm: str,
+    workers: int,
+    incremental: bool,
+) -> None:
+    info(f"Calculating {algorithm} file hashes for {path}")
+
+    root = get_root(path)
+    files = get_files(path)
+    previous = load_previous(output, algorithm, root) if incremental else {}
+    pending: List[str] = []
+
+    for file_path, entry in files.items():
+        previous_entry = previous.get(file_path)
+        if (
+            previous_entry
+            and previous_entry["size"] == entry["size"]
+            and previous_entry["mtime"] == entry["mtime"]
+        ):
+            entry["hash"] = previous_entry["hash"]
+        else:
+            pending.append(file_path)
+
+    info(f"Hashing {len(pending)} files, reusing {len(files) - len(pending)} hashes")
+
+    # the hashing happens in chunks outside the GIL, so threads overlap the reads
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        hashes = executor.map(
+            partial(get_file_hash, algorithm=algorithm),
+            (root.joinpath(p) for p in pending),
+        )
+        for file_path, file_hash in zip(pending, hashes):
+            files[file_path]["hash"] = file_hash
+
+    info(f"Dumping hashes to {output}")
+    dump_output({"algorithm": algorithm, "files": files}, output)
     info("Hash calculation finished")
+
+
+def load_manifest(manifest: Path, root: Path) -> Tuple[str, Dict[str, Dict[str, Any]]]:
+    with manifest.open("r", encoding="utf-8") as fp:
+        data: Dict[str, Any] = load(fp)
+    if "files" in data:
+        return data["algorithm"], get_relative_files(data["files"], root)
+    # the earlier output format only mapped the paths to their md5 hashes
+    return "md5", get_relative_files(
+        {file_path: {"hash": file_hash} for file_path, file_hash in data.items()},
+        root,
+    )
+
+
+def verify_tree(
+    path: Path,
+    output: Path,
+    manifest: Path,
+    workers: int,
+    fail_fast: bool,
+) -> None:
+    info(f"Verifying {path} against {manifest}")
+
+    root = get_root(path)
+    algorithm, expected = load_manifest(manifest, root)
+    files = get_files(path)
+    report: Dict[str, Any] = {
+        "algorithm": algorithm,
+        "matched": 0,
+        "missing": sorted(p for p in expected if p not in files),
+        "extra": sorted(p for p in files if p not in expected),
+        "changed": [],
+    }
+
+    # only the files with the expected size need to be hashed
+    candidates: List[str] = []
+    for file_path in sorted(p for p in files if p in expected):
+        expected_size = expected[file_path].get("size")
+        if expected_size is None or expected_size == files[file_path]["size"]:
+            candidates.append(file_path)
+        else:
+            report["changed"].append(file_path)
+
+    if fail_fast and (report["missing"] or report["extra"] or report["changed"]):
+        candidates = []
+
+    info(f"Hashing {len(candidates)} files with the expected size")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(get_file_hash, root.joinpath(p), algorithm): p
+            for p in candidates
+        }
+        for future in as_completed(futures):
+            file_path = futures[future]
+            if future.result() == expected[file_path]["hash"]:
+                report["matched"] += 1
+            else:
+                report["changed"].append(file_path)
+                if fail_fast:
+                    executor.shutdown(wait=True, cancel_futures=True)
+                    break
+
+    # with fail-fast, some of the files may have been left unchecked
+    report["changed"].sort()
+    report["complete"] = report["matched"] + len(report["changed"]) + len(
+        report["missing"]
+    ) == len(expected)
+
+    for key in ("missing", "extra", "changed"):
+        if report[key]:
+            warning(f"Found {len(report[key])} {key} files")
+
+    info(f"Dumping verification report to {output}")
+    dump_output(report, output)
+    info(f"Verification finished with {report['matched']} matching files")
+
+
+def get_partial_hash(path: Path, size: int, partial_size: int, algorithm: str) -> str:
+    # the first and last bytes of the file, or the whole file when it is small
+    digest = new_hash(algorithm)
+    with open(path, "rb") as fp:
+        if size <= 2 * partial_size:
+            digest.update(fp.read())
+        else:
+            digest.update(fp.read(partial_size))
+            fp.seek(size - partial_size)
+            digest.update(fp.read(partial_size))
+    return digest.hexdigest()
+
+
+def group_by_hash(
+    groups: List[List[str]],
+    hash_function: Callable[[str], str],
+    workers: int,
+) -> List[List[str]]:
+    # the groups are split further by the hash, so files are only compared within
+    collisions: Dict[Tuple[int, str], List[str]] = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        hashes = executor.map(hash_function, (p for group in groups for p in group))
+        for index, group in enumerate(groups):
+            for file_path in group:
+                collisions.setdefault((index, next(hashes)), []).append(file_path)
+    return [sorted(g) for g in collisions.values() if len(g) > 1]
+
+
+def find_duplicates(
+    path: Path,
+    output: Path,
+    algorithm: str,
+    workers: int,
+    partial_size: int,
+) -> None:
+    info(f"Finding duplicate files in {path}")
+
+    root = get_root(path)
+    files = get_files(path)
+    sizes: Dict[str, int] = {p: entry["size"] for p, entry in files.items()}
+    total_bytes = sum(sizes.values())
+
+    # files can only be identical when they have the same size
+    by_size: Dict[int, List[str]] = {}
+    for file_path, entry in sorted(files.items()):
+        if entry["size"] > 0:
+            by_size.setdefault(entry["size"], []).append(file_path)
+    groups = [group for group in by_size.values() if len(group) > 1]
+    info(f"Found {sum(len(g) for g in groups)} files in {len(groups)} size groups")
+
+    groups = group_by_hash(
+        groups,
+        lambda p: get_partial_hash(root.joinpath(p), sizes[p], partial_size, algorithm),
+        workers,
+    )
+    info(f"Found {sum(len(g) for g in groups)} files in {len(groups)} partial groups")
+
+    # the partial hash already covered the whole content of the small files
+    clusters = [g for g in groups if sizes[g[0]] <= 2 * partial_size]
+    groups = [g for g in groups if sizes[g[0]] > 2 * partial_size]
+    full_hash_bytes = sum(sizes[p] for group in groups for p in group)
+    clusters.extend(
+        group_by_hash(
+            groups, lambda p: get_file_hash(root.joinpath(p), algorithm), workers
+        )
+    )
+    clusters.sort(key=lambda g: (-sizes[g[0]] * (len(g) - 1), g[0]))
+
+    report: Dict[str, Any] = {
+        "algorithm": algorithm,
+        "files": len(files),
+        "bytes": total_bytes,
+        "duplicate_files": sum(len(c) - 1 for c in clusters),
+        "duplicate_bytes": sum(sizes[c[0]] * (len(c) - 1) for c in clusters),
+        "full_hash_bytes": full_hash_bytes,
+        "full_hash_bytes_spared": total_bytes - full_hash_bytes,
+        "clusters": clusters,
+    }
+
+    info(
+        f"Found {report['duplicate_files']} duplicate files in {len(clusters)} clusters"
+        f", fully hashing {full_hash_bytes} of {total_bytes} bytes"
+    )
+    info(f"Dumping duplicate clusters to {output}")
+    dump_output(report, output)
+
+
+def run_script(
+    path: Path,
+    output: Path,
+    algorithm: str,
+    workers: int,
+    incremental: bool,
+    verify: Path | None,
+    fail_fast: bool,
+    duplicates: bool,
+    partial_size: int,
+) -> None:
+    if verify:
+        verify_tree(path, output, verify, workers, fail_fast)
+    elif duplicates:
+        find_duplicates(path, output, algorithm, workers, partial_size)
+    else:
+        hash_tree(path, output, algorithm, workers, incremental)
@@ -0,0 +1,42 @@
+from os import cpu_count
+from pathlib import Path
+from logging import info
+from argparse import ArgumentParser
+
+from utilities.quadindex import open_index, update_index
+
+
+def register_args(parser: ArgumentParser) -> None:
+    parser.description = "Build or update a quad index of a SolidBench dataset on disk"
+    parser.add_argument(
+        "--pods",
+        help="Path to the SolidBench dataset pods",
+        required=True,
+        type=Path,
+    )
+    parser.add_argument(
+        "--index",
+        help="Path to the SQLite index to create or update",
+        required=True,
+        type=Path,
+    )
+    parser.add_argument(
+        "--extensions",
+        help="Comma-separated list of extensions to parse as RDF",
+        default=".nq",
+    )
+    parser.add_argument(
+        "--workers",
+        help="Number of processes to parse the changed documents with",
+        default=cpu_count(),
+        type=int,
+    )
+
+
+def run_script(pods: Path, index: Path, extensions: str, workers: int) -> None:
+    info(f"Updating index {index} for {pods}")
+    connection = open_index(index)
+    try:
+        update_index(connection, pods, set(extensions.split(",")), workers)
+    finally:
+        connection.close()
@@ -1,17 +1,38 @@
-from typing import Dict, Set, List
+from os import cpu_count, replace
+from pickle import dump as pickle_dump, load as pickle_load
+from hashlib import blake2b
+from time import perf_counter
+from typing import Any, Dict, Set, List, Tuple, Iterable, Iterator
 from pathlib import Path
+from rdflib import __version__ as rdflib_version
 from rdflib.term import Variable, Literal, URIRef, Node, BNode
 from rdflib.graph import Graph
 from rdflib.paths import Path as SPARQLPath, AlternativePath, SequencePath, InvPath, NegatedPath, MulPath
 from rdflib.plugins.sparql import prepareQuery
 from csv import DictWriter
-from logging import info, debug
+from logging import info, debug, warning
 from argparse import ArgumentParser
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+from utilities.quadindex import get_pods, read_index
+from utilities.walker import list_directories, list_files
 
 
 QUERY_EXCLUSIONS: Set[str] = set(("complex",))
 QUERY_EXTENSIONS: Set[str] = set((".sparql", ".rq"))
 QUERY_DELIMITER: str = "\n\n"
+# the patterns extracted from each query are cached next to the queries
+PATTERN_CACHE_NAME: str = ".patterns.pickle"
+PATTERN_CACHE_VERSION: int = 1
+QUERY_FIELDNAMES: List[str] = [
+    "query",
+    "patterns",
+    "union_documents",
+    "intersection_documents",
+    "union_pods",
+    "intersection_pods",
+]
 
 class TriplePattern(object):
     def __init__(self, s: URIRef | BNode | Variable, p: URIRef | SPARQLPath, o: URIRef | Literal | Variable) -> None:
@@ -71,6 +92,42 @@ class TriplePattern(object):
         return False
 
 
+def get_indexed_predicates(p: URIRef | SPARQLPath) -> Set[URIRef] | None:
+    # the predicates that a pattern can match, or None when it needs a full check
+    if isinstance(p, URIRef):
+        return set((p,))
+    elif isinstance(p, AlternativePath) or isinstance(p, SequencePath):
+        return set(x for x in p.args if isinstance(x, URIRef))
+    elif isinstance(p, MulPath):
+        return set((p.path,)) if isinstance(p.path, URIRef) else set()
+    elif isinstance(p, InvPath) or isinstance(p, NegatedPath):
+        return None
+    return set()
+
+
+class PatternIndex(object):
+    # pattern values by (predicate, subject, object), None for variables
+    def __init__(self, patterns: Iterable[Tuple[TriplePattern, Any]]) -> None:
+        self.index: Dict[Tuple[Node, Node | None, Node | None], List[Any]] = {}
+        self.fallback: List[Tuple[TriplePattern, Any]] = []
+        for pattern, value in patterns:
+            predicates = get_indexed_predicates(pattern.p)
+            if predicates is None:
+                self.fallback.append((pattern, value))
+                continue
+            s = None if pattern.s_var else pattern.s
+            o = None if pattern.o_var else pattern.o
+            for predicate in predicates:
+                self.index.setdefault((predicate, s, o), []).append(value)
+
+    def match(self, s: Node, p: Node, o: Node) -> Iterator[Any]:
+        for key in ((p, s, o), (p, s, None), (p, None, o), (p, None, None)):
+            yield from self.index.get(key, ())
+        for pattern, value in self.fallback:
+            if pattern.match(s, p, o):
+                yield value
+
+
 def register_args(parser: ArgumentParser) -> None:
     parser.description = "Produce a report of triple patterns and their matches in SolidBench"
     parser.add_argument(
@@ -96,26 +153,110 @@ def register_args(parser: ArgumentParser) -> None:
         help="Comma-separated list of extensions to parse as RDF",
         default=".nq",
     )
+    parser.add_argument(
+        "--workers",
+        help="Number of processes to scan the pods with",
+        default=cpu_count(),
+        type=int,
+    )
+    parser.add_argument(
+        "--no-cache",
+        help="Parse the queries without using or updating the pattern cache",
+        dest="cache",
+        action="store_false",
+    )
+    parser.add_argument(
+        "--index",
+        help="Path to a quad index to match the patterns against instead of files",
+        type=Path,
+    )
+    parser.add_argument(
+        "--query-output",
+        help="Path to serialize the matches of any and all patterns per query to",
+        type=Path,
+    )
+
+
+def get_query_patterns(query_string: str) -> List[TriplePattern]:
+    query = prepareQuery(query_string)
+    queue = [query.algebra]
+    query_patterns = []
+    while queue:
+        item = queue.pop(0)
+        if isinstance(item, dict):
+            for key, value in item.items():
+                if key == "triples":
+                    for pattern in [p for p in value if len(p) == 3]:
+                        query_patterns.append(TriplePattern(*pattern))
+                else:
+                    queue.append(value)
+    return query_patterns
+
+
+def get_query_key(query_string: str) -> str:
+    # the indentation and line endings do not change the parsed query
+    lines = (line.strip() for line in query_string.strip().splitlines())
+    normalized = "\n".join(line for line in lines if line)
+    return blake2b(f"{rdflib_version}\n{normalized}".encode()).hexdigest()
+
+
+def load_pattern_cache(path: Path) -> Dict[str, List[TriplePattern]]:
+    if not path.is_file():
+        return {}
+    try:
+        with open(path, "rb") as cache_file:
+            cache: Dict[str, Any] = pickle_load(cache_file)
+    except Exception as ex:
+        debug(f"Unable to read cache {path}: {ex}")
+        return {}
+    if (
+        cache.get("version") != PATTERN_CACHE_VERSION
+        or cache.get("rdflib") != rdflib_version
+    ):
+        debug(f"Invalidating stale cache {path}")
+        return {}
+    return cache["patterns"]
+
+
+def save_pattern_cache(path: Path, patterns: Dict[str, List[TriplePattern]]) -> None:
+    temporary_path = path.with_name(f"{path.name}.tmp")
+    cache = {
+        "version": PATTERN_CACHE_VERSION,
+        "rdflib": rdflib_version,
+        "patterns": patterns,
+    }
+    try:
+        with open(temporary_path, "wb") as cache_file:
+            pickle_dump(cache, cache_file)
+        replace(temporary_path, path)
+    except OSError as ex:
+        warning(f"Unable to write cache {path}: {ex}")
 
 
-def extract_patterns(query_strings: Dict[str, str]) -> Dict[str, List[TriplePattern]]:
-    output: Dict[str, TriplePattern] = {}
-    pattern_count = 0
-    for query_id, query_string in query_strings.items():
-        query = prepareQuery(query_string)
-        queue = [query.algebra]
-        query_patterns = []
-        while queue:
-            item = queue.pop(0)
-            if isinstance(item, dict):
-                for key, value in item.items():
-                    if key == "triples":
-                        for pattern in [p for p in value if len(p) == 3]:
-                            pattern_count += 1
-                            query_patterns.append(TriplePattern(*pattern))
-                    else:
-                        queue.append(value)
-        output[query_id] = query_patterns
+def extract_patterns(
+    query_strings: Dict[str, str], workers: int = 1, cache_path: Path | None = None
+) -> Dict[str, List[TriplePattern]]:
+    cache = load_pattern_cache(cache_path) if cache_path else {}
+    keys = dict((query_id, get_query_key(q)) for query_id, q in query_strings.items())
+    # identical queries are only parsed once
+    pending = dict(
+        (keys[query_id], q)
+        for query_id, q in query_strings.items()
+        if keys[query_id] not in cache
+    )
+    info(f"Parsing {len(pending)} distinct queries, reusing the rest from cache")
+    workers = min(workers, len(pending))
+    if workers < 2:
+        parsed = map(get_query_patterns, pending.values())
+        cache.update(zip(pending.keys(), parsed))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parsed = executor.map(get_query_patterns, pending.values())
+            cache.update(zip(pending.keys(), parsed))
+    if cache_path and pending:
+        save_pattern_cache(cache_path, cache)
+    output = dict((query_id, cache[key]) for query_id, key in keys.items())
+    pattern_count = sum(len(patterns) for patterns in output.values())
     info(f"Extracted {pattern_count} patterns from {len(query_strings)} queries")
     return output
 
@@ -137,62 +278,226 @@ def load_queries(path: Path) -> Dict[str, str]:
     return output
 
 
-def run_script(pods: Path, queries: Path, output: Path, extensions: str) -> None:
+class PodMatches(object):
+    # match counters of one pod, documents kept as bitsets of their ids
+    def __init__(self, patterns: int) -> None:
+        self.documents = 0
+        self.triples = 0
+        self.matching_triples: List[int] = [0] * patterns
+        self.matching_documents: List[int] = [0] * patterns
+
+
+def get_pod_matches(
+    pod: Path, patterns: List[TriplePattern], extensions: Set[str]
+) -> Tuple[PodMatches, float]:
+    start = perf_counter()
+    pattern_index = PatternIndex((pattern, i) for i, pattern in enumerate(patterns))
+    matches = PodMatches(len(patterns))
+    for entry in list_files(pod, extensions):
+        data = Graph()
+        data.parse(entry.path)
+        document_bit = 1 << matches.documents
+        matches.documents += 1
+        document_matches: Set[int] = set()
+        for s, p, o in data:
+            matches.triples += 1
+            for i in pattern_index.match(s, p, o):
+                matches.matching_triples[i] += 1
+                document_matches.add(i)
+        for i in document_matches:
+            matches.matching_documents[i] |= document_bit
+    return matches, perf_counter() - start
+
+
+def merge_pod_matches(
+    pod_paths: List[Path],
+    results: Iterable[Tuple[PodMatches, float | None]],
+    metrics_list: List[Dict[str, Any]],
+) -> Tuple[int, int, List[int], List[List[int]]]:
+    total_documents = 0
+    total_triples = 0
+    # the pods matching each pattern, and the documents per pod and pattern
+    pod_bitsets: List[int] = [0] * len(metrics_list)
+    document_bitsets: List[List[int]] = []
+    for pod_id, (pod, (matches, duration)) in enumerate(zip(pod_paths, results)):
+        info(
+            f"Processed pod {pod} with {matches.documents} documents"
+            f" and {matches.triples} triples"
+            + ("" if duration is None else f" in {duration:.2f} s")
+        )
+        total_documents += matches.documents
+        total_triples += matches.triples
+        for i, metrics in enumerate(metrics_list):
+            documents = matches.matching_documents[i]
+            metrics["matching_triples"] += matches.matching_triples[i]
+            metrics["matching_documents"] += documents.bit_count()
+            if documents:
+                pod_bitsets[i] |= 1 << pod_id
+        document_bitsets.append(matches.matching_documents)
+    for metrics, pods in zip(metrics_list, pod_bitsets):
+        metrics["matching_pods"] = pods.bit_count()
+    return total_documents, total_triples, pod_bitsets, document_bitsets
+
+
+def get_index_matches(
+    pods: Path, index: Path, patterns: List[TriplePattern]
+) -> Tuple[List[Path], List[Tuple[PodMatches, float | None]]]:
+    # match the patterns against the default graph triples of a quad index
+    start = perf_counter()
+    connection = read_index(index)
+    try:
+        pod_ids = get_pods(connection)
+        pod_positions = dict((pod_id, i) for i, (pod_id, _) in enumerate(pod_ids))
+        pod_matches = [PodMatches(len(patterns)) for _ in pod_ids]
+        # the documents get dense IDs within their pod, in the order of the index
+        document_bits: Dict[int, Tuple[PodMatches, int]] = {}
+        for document_id, pod_id, triples in connection.execute(
+            "SELECT id, pod, triples FROM documents ORDER BY id"
+        ):
+            matches = pod_matches[pod_positions[pod_id]]
+            document_bits[document_id] = (matches, 1 << matches.documents)
+            matches.documents += 1
+            matches.triples += triples
+
+        def get_term_id(term: str) -> int | None:
+            row = connection.execute("SELECT id FROM terms WHERE term = ?", (term,))
+            return next(iter(row.fetchone() or ()), None)
+
+        index_predicates = [
+            URIRef(term[1:-1])
+            for (term,) in connection.execute(
+                "SELECT term FROM terms WHERE id IN (SELECT DISTINCT p FROM quads)"
+            )
+        ]
+        for i, pattern in enumerate(patterns):
+            predicates = get_indexed_predicates(pattern.p)
+            if predicates is None:
+                # the fallback patterns only depend on the predicate once s and o match
+                predicates = set(
+                    p
+                    for p in index_predicates
+                    if pattern.match(pattern.s, p, pattern.o)
+                )
+            conditions = ["g IS NULL"]
+            parameters: List[int | None] = []
+            predicate_ids = [get_term_id(f"<{p.toPython()}>") for p in predicates]
+            predicate_ids = [p for p in predicate_ids if p is not None]
+            conditions.append(f"p IN ({', '.join('?' * len(predicate_ids))})")
+            parameters.extend(predicate_ids)
+            for column, term, variable in (
+                ("s", pattern.s, pattern.s_var),
+                ("o", pattern.o, pattern.o_var),
+            ):
+                if not variable:
+                    conditions.append(f"{column} = ?")
+                    parameters.append(get_term_id(term.n3()))
+            for document_id, count in connection.execute(
+                "SELECT document, COUNT(*) FROM quads"
+                f" WHERE {' AND '.join(conditions)} GROUP BY document",
+                parameters,
+            ):
+                matches, document_bit = document_bits[document_id]
+                matches.matching_triples[i] += count
+                matches.matching_documents[i] |= document_bit
+    finally:
+        connection.close()
+    duration = perf_counter() - start
+    info(f"Matched {len(patterns)} patterns against {index} in {duration:.2f} s")
+    pod_paths = [pods.joinpath(name) for _, name in pod_ids]
+    return pod_paths, [(matches, None) for matches in pod_matches]
+
+
+def get_query_metrics(
+    positions: List[int], pod_bitsets: List[int], document_bitsets: List[List[int]]
+) -> Dict[str, int]:
+    # the documents of different pods are disjoint, so the pods are combined apart
+    union_documents = 0
+    intersection_documents = 0
+    for pod_documents in document_bitsets:
+        union = 0
+        intersection = -1 if positions else 0
+        for i in positions:
+            union |= pod_documents[i]
+            intersection &= pod_documents[i]
+        union_documents += union.bit_count()
+        intersection_documents += intersection.bit_count()
+    union_pods = 0
+    intersection_pods = -1 if positions else 0
+    for i in positions:
+        union_pods |= pod_bitsets[i]
+        intersection_pods &= pod_bitsets[i]
+    return {
+        "patterns": len(positions),
+        "union_documents": union_documents,
+        "intersection_documents": intersection_documents,
+        "union_pods": union_pods.bit_count(),
+        "intersection_pods": intersection_pods.bit_count(),
+    }
+
+
+def run_script(
+    pods: Path,
+    queries: Path,
+    output: Path,
+    extensions: str,
+    workers: int = 1,
+    cache: bool = True,
+    query_output: Path | None = None,
+    index: Path | None = None,
+) -> None:
     query_strings = load_queries(queries)
-    query_patterns = extract_patterns(query_strings)
+    cache_path = queries.joinpath(PATTERN_CACHE_NAME) if cache else None
+    query_patterns = extract_patterns(query_strings, workers, cache_path)
 
     info(f"Processing SolidBench dataset from {pods}")
 
     rdf_ext = set(extensions.split(","))
 
-    pattern_metrics: Dict[TriplePattern, Dict[str, int | Set[str | Path]]] = {}
+    pattern_metrics: Dict[TriplePattern, Dict[str, int | Set[str]]] = {}
 
     for query, patterns in query_patterns.items():
         for pattern in patterns:
             if pattern not in pattern_metrics:
                 pattern_metrics[pattern] = {
-                    "matching_documents": set(),
+                    "matching_documents": 0,
                     "matching_triples": 0,
-                    "matching_pods": set(),
+                    "matching_pods": 0,
                     "containing_queries": set([ query ]),
                 }
             else:
                 pattern_metrics[pattern]["containing_queries"].add(query)
 
-    total_documents = 0
-    total_triples = 0
-    total_pods = 0
-
-    for pod in pods.iterdir():
-        info(f"Processing pod {pod}")
-        total_pods += 1
-        path_queue = set(pod.iterdir())
-        while path_queue:
-            path = path_queue.pop()
-            if path.is_dir():
-                path_queue.update(path.iterdir())
-            elif path.is_file() and any(path.name.endswith(ext) for ext in rdf_ext):
-                data = Graph()
-                data.parse(path)
-                total_documents += 1
-                for s, p, o in data:
-                    total_triples += 1
-                    for pattern, metrics in pattern_metrics.items():
-                        if pattern.match(s, p, o):
-                            metrics["matching_triples"] += 1
-                            metrics["matching_pods"].add(pod)
-                            metrics["matching_documents"].add(path)
-            else:
-                debug(f"Skipping: {path}")
+    pod_paths = list_directories(pods)
+    map_function = partial(
+        get_pod_matches, patterns=list(pattern_metrics.keys()), extensions=rdf_ext
+    )
+    metrics_list = list(pattern_metrics.values())
+
+    if index:
+        patterns = list(pattern_metrics.keys())
+        pod_paths, results = get_index_matches(pods, index, patterns)
+        total_documents, total_triples, pod_bitsets, document_bitsets = (
+            merge_pod_matches(pod_paths, results, metrics_list)
+        )
+    elif workers < 2 or len(pod_paths) < 2:
+        total_documents, total_triples, pod_bitsets, document_bitsets = (
+            merge_pod_matches(pod_paths, map(map_function, pod_paths), metrics_list)
+        )
+    else:
+        # the pods are independent, so each one is scanned by a single worker
+        info(f"Processing {len(pod_paths)} pods using {workers} workers")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(map_function, pod_paths)
+            total_documents, total_triples, pod_bitsets, document_bitsets = (
+                merge_pod_matches(pod_paths, results, metrics_list)
+            )
 
     for pattern, metrics in pattern_metrics.items():
         metrics["pattern"] = pattern
         metrics["total_documents"] = total_documents
-        metrics["total_pods"] = total_pods
+        metrics["total_pods"] = len(pod_paths)
         metrics["total_triples"] = total_triples
         metrics["total_queries"] = len(query_patterns)
-        metrics["matching_documents"] = len(metrics["matching_documents"])
-        metrics["matching_pods"] = len(metrics["matching_pods"])
         metrics["containing_queries"] = len(metrics["containing_queries"])
 
     info(f"Dumping metrics to {output}")
@@ -202,3 +507,24 @@ def run_script(pods: Path, queries: Path, output: Path, extensions: str) -> None
         writer = DictWriter(output_file, fieldnames=fieldnames, delimiter="\t")
         writer.writeheader()
         writer.writerows(pattern_metrics.values())
+
+    if query_output:
+        positions = dict((pattern, i) for i, pattern in enumerate(pattern_metrics))
+        query_metrics: List[Dict[str, Any]] = []
+        for query, patterns in query_patterns.items():
+            query_positions = sorted(set(positions[p] for p in patterns))
+            query_metrics.append(
+                {
+                    "query": query,
+                    **get_query_metrics(query_positions, pod_bitsets, document_bitsets),
+                }
+            )
+
+        info(f"Dumping query metrics to {query_output}")
+
+        with open(query_output, "w") as output_file:
+            writer = DictWriter(
+                output_file, fieldnames=QUERY_FIELDNAMES, delimiter="\t"
+            )
+            writer.writeheader()
+            writer.writerows(query_metrics)
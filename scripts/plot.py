@@ -10,6 +10,8 @@ from matplotlib.ticker import MaxNLocator
 from matplotlib.figure import Figure
 from matplotlib.pyplot import figure, get_cmap
 
+from utilities.diefficiency import dief_at_k_single
+
 
 ROW_INCHES: int = 4
 COLUMN_INCHES: int = 6
@@ -104,14 +106,7 @@ def get_query_times(result_directory: Path) -> Dict[str, Dict[str, float]]:
 
 
 def dief_k_full(timestamps: List[float]) -> float:
-    integral: float = 0
-    previous_result_count: int = 0
-    previous_timestamp: float = 0
-    for timestamp in timestamps:
-        integral += (timestamp - previous_timestamp) * (previous_result_count + 0.5)
-        previous_result_count += 1
-        previous_timestamp = timestamp
-    return round(integral, 3)
+    return round(dief_at_k_single(timestamps, linear=True), 3)
 
 
 def plot_timestamps(
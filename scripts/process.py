@@ -1,126 +1,229 @@
-from json import loads
+from os import cpu_count, scandir
+from json import loads, dump
 from pathlib import Path
-from statistics import mean
-from typing import Tuple, List, Dict, Any
+from logging import info, debug
+from itertools import groupby
+from functools import partial
+from array import array as NumericArray
+from argparse import ArgumentParser
+from typing import Tuple, List, Dict, Any, Iterable
+from concurrent.futures import ProcessPoolExecutor
+from numpy import ndarray, array, frombuffer, int64, minimum, maximum
 
+from utilities.sorting import natural_sort_key
+from utilities.jsonstream import iter_json_tokens, PUNCTUATION
+from utilities.hashing import get_file_hash, is_file_unchanged
 
-def get_result_timestamps(data: Dict[str, Dict[str, Any]]) -> List[int]:
-    timestamps: List[int] = []
-    for key in data["result_data"].keys():
-        timestamps.append(int(key))
+SCALAR_COLUMNS: Tuple[str, ...] = ("time", "results", "httpRequests", "restarts")
+OUTPUT_NAME = "query-times.csv"
+MANIFEST_VERSION = 1
+
+
+def register_args(parser: ArgumentParser) -> None:
+    parser.description = "Aggregate raw runner output into query-times.csv per config"
+    parser.add_argument(
+        "--results",
+        help="Path containing the result directories with one directory per config",
+        default=Path(__file__).parent.parent.joinpath("results"),
+        type=Path,
+    )
+    parser.add_argument(
+        "--workers",
+        help="Number of processes to read the runner output with",
+        default=cpu_count(),
+        type=int,
+    )
+    parser.add_argument(
+        "--force",
+        help="Process all configs, including the ones whose input has not changed",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--streaming",
+        help="Extract the needed fields incrementally to bound the memory use",
+        action="store_true",
+    )
+
+
+class QueryAggregate:
+    # mergeable integer aggregates of the repetitions of one query
+    name: str
+    id: str
+    count: int
+    timeout: bool
+    sums: Dict[str, int]
+    minimums: Dict[str, int]
+    maximums: Dict[str, int]
+    timestamps_count: int
+    timestamps_sum: ndarray
+    timestamps_min: ndarray
+    timestamps_max: ndarray
+
+    def __init__(
+        self,
+        name: str,
+        id: str,
+        scalars: Dict[str, int],
+        timeout: bool,
+        timestamps: ndarray,
+    ) -> None:
+        self.name = name
+        self.id = id
+        self.count = 1
+        self.timeout = timeout
+        self.sums = dict(scalars)
+        self.minimums = dict(scalars)
+        self.maximums = dict(scalars)
+        self.timestamps_count = 1
+        self.timestamps_sum = timestamps
+        self.timestamps_min = timestamps
+        self.timestamps_max = timestamps
+
+    def merge(self, other: "QueryAggregate") -> "QueryAggregate":
+        self.count += other.count
+        self.timeout = self.timeout or other.timeout
+        for column in SCALAR_COLUMNS:
+            self.sums[column] += other.sums[column]
+            self.minimums[column] = min(self.minimums[column], other.minimums[column])
+            self.maximums[column] = max(self.maximums[column], other.maximums[column])
+        if len(other.timestamps_sum) > len(self.timestamps_sum):
+            self.timestamps_count = other.timestamps_count
+            self.timestamps_sum = other.timestamps_sum
+            self.timestamps_min = other.timestamps_min
+            self.timestamps_max = other.timestamps_max
+        elif len(other.timestamps_sum) == len(self.timestamps_sum):
+            self.timestamps_count += other.timestamps_count
+            self.timestamps_sum = self.timestamps_sum + other.timestamps_sum
+            self.timestamps_min = minimum(self.timestamps_min, other.timestamps_min)
+            self.timestamps_max = maximum(self.timestamps_max, other.timestamps_max)
+        return self
+
+    def to_row(self) -> Dict[str, Any]:
+        row: Dict[str, Any] = {"name": self.name, "id": self.id}
+        for column in SCALAR_COLUMNS:
+            row[column] = int(self.sums[column] / self.count)
+            row[f"{column}Min"] = self.minimums[column]
+            row[f"{column}Max"] = self.maximums[column]
+        # the reported result count is the highest among the repetitions
+        row["results"] = self.maximums["results"]
+        row["error"] = "true" if row["results"] < 1 else "false"
+        row["timeout"] = "true" if self.timeout else "false"
+        for column, values in (
+            ("timestamps", self.timestamps_sum / self.timestamps_count),
+            ("timestampsMin", self.timestamps_min),
+            ("timestampsMax", self.timestamps_max),
+        ):
+            row[column] = list(str(round(k / 1000000)) for k in values.tolist())
+        return row
+
+
+# the top-level fields of the runner output that are needed for the aggregation
+RESULT_FIELDS: Tuple[str, ...] = (
+    "engine_query",
+    "time_taken_seconds",
+    "result_count",
+    "requested_urls_count",
+    "engine_timeout_reached",
+)
+
+
+def get_result_timestamps(data: Dict[str, Dict[str, Any]]) -> ndarray:
+    timestamps = array([int(key) for key in data["result_data"].keys()], dtype=int64)
     timestamps.sort()
     return timestamps
 
 
-def process_from_path(path: Path) -> Dict[str, Dict[str, Any]] | None:
-    print(f"Processing: {path.as_posix()}")
-    output: Dict[Tuple[str, str], Dict[str, Any]] = {}
-    for result in path.iterdir():
-        if not result.name.endswith(".json"):
-            continue
-        with open(result, "r") as result_file:
-            data: Dict[str, Any] = loads(result_file.read())
-            name, id = data["engine_query"].split("/queries/")[-1].split(".sparql#")
-            timestamps: List[int] = get_result_timestamps(data)
-            result_count: int = data["result_count"]
-            http_requests: int = data["requested_urls_count"]
-            restart_count: int = len(data["result_data_other"])
-            query_time: float = round(float(data["time_taken_seconds"]) * 1000)
-            if (name, id) not in output:
-                output[(name, id)] = {
-                    "name": name,
-                    "id": id,
-                    "error": False,
-                    "time": query_time,
-                    "timeMin": query_time,
-                    "timeMax": query_time,
-                    "timeout": data["engine_timeout_reached"],
-                    "results": result_count,
-                    "resultsMin": result_count,
-                    "resultsMax": result_count,
-                    "timestamps": timestamps,
-                    "timestampsMin": timestamps,
-                    "timestampsMax": timestamps,
-                    "httpRequests": http_requests,
-                    "httpRequestsMin": http_requests,
-                    "httpRequestsMax": http_requests,
-                    "restarts": restart_count,
-                    "restartsMin": restart_count,
-                    "restartsMax": restart_count,
-                }
-            else:
-                output_name_id = output[(name, id)]
-                previous_result_count: int = output_name_id["results"]
-                output_name_id["time"] = mean((query_time, output_name_id["time"]))
-                output_name_id["timeMin"] = min(query_time, output_name_id["timeMin"])
-                output_name_id["timeMax"] = max(query_time, output_name_id["timeMax"])
-                output_name_id["results"] = max(result_count, output_name_id["results"])
-                output_name_id["resultsMin"] = max(
-                    result_count, output_name_id["resultsMin"]
-                )
-                output_name_id["resultsMax"] = max(
-                    result_count, output_name_id["resultsMax"]
-                )
-                output_name_id["timeout"] = (
-                    output_name_id["timeout"] or data["engine_timeout_reached"]
-                )
-                output_name_id["restarts"] = mean(
-                    (restart_count, output_name_id["restarts"])
-                )
-                output_name_id["restartsMin"] = min(
-                    restart_count, output_name_id["restartsMin"]
-                )
-                output_name_id["restartsMax"] = max(
-                    restart_count, output_name_id["restartsMax"]
-                )
-                output_name_id["httpRequests"] = mean(
-                    (http_requests, output_name_id["httpRequests"])
-                )
-                output_name_id["httpRequestsMin"] = min(
-                    http_requests, output_name_id["httpRequestsMin"]
-                )
-                output_name_id["httpRequestsMax"] = max(
-                    http_requests, output_name_id["httpRequestsMax"]
-                )
-                if result_count > previous_result_count:
-                    print(f"Increased number of results for {name}-{id}")
-                    output_name_id["timestamps"] = timestamps
-                    output_name_id["timestampsMin"] = timestamps
-                    output_name_id["timestampsMax"] = timestamps
+def read_result_file(path: Path) -> Dict[str, Any]:
+    with open(path, "r") as result_file:
+        data: Dict[str, Any] = loads(result_file.read())
+    return {
+        **{field: data[field] for field in RESULT_FIELDS},
+        "timestamps": get_result_timestamps(data),
+        "restarts": len(data["result_data_other"]),
+    }
+
+
+def read_result_file_streaming(path: Path) -> Dict[str, Any]:
+    # only the needed fields are extracted, so memory use does not grow with the
+    # size of the result bindings, and the timestamps go directly into an array
+    output: Dict[str, Any] = {"restarts": 0}
+    timestamps = NumericArray("q")
+    containers: List[str] = []
+    expect_key = False
+    field: str | None = None
+    with open(path, "r") as result_file:
+        for kind, token in iter_json_tokens(result_file):
+            depth = len(containers)
+            in_other = depth == 2 and field == "result_data_other"
+            if kind == PUNCTUATION:
+                if token == "{" or token == "[":
+                    if in_other and containers[-1] == "[":
+                        output["restarts"] += 1
+                    containers.append(token)
+                    expect_key = token == "{"
+                elif token == "}" or token == "]":
+                    containers.pop()
+                    expect_key = False
+                elif token == ",":
+                    expect_key = containers[-1] == "{"
                 else:
-                    for i in range(0, len(timestamps)):
-                        old_timestamp = output_name_id["timestamps"][i]
-                        new_timestamp = mean((old_timestamp, timestamps[i]))
-                        output_name_id["timestamps"][i] = new_timestamp
-                        output_name_id["timestampsMin"][i] = min(
-                            old_timestamp, timestamps[i]
-                        )
-                        output_name_id["timestampsMax"][i] = max(
-                            old_timestamp, timestamps[i]
-                        )
-    for result in output.values():
-        for column in ("timestamps", "timestampsMin", "timestampsMax"):
-            result[column] = list(str(round(k / 1000000)) for k in result[column])
-        for column in (
-            "time",
-            "timeMin",
-            "timeMax",
-            "results",
-            "resultsMin",
-            "resultsMax",
-            "httpRequests",
-            "httpRequestsMin",
-            "httpRequestsMax",
-            "restarts",
-            "restartsMin",
-            "restartsMax",
-        ):
-            result[column] = int(result[column])
-        result["error"] = "true" if result["results"] < 1 else "false"
-        result["timeout"] = "true" if result["timeout"] else "false"
+                    expect_key = False
+            elif expect_key:
+                if depth == 1:
+                    field = loads(token)
+                elif depth == 2 and field == "result_data":
+                    timestamps.append(int(loads(token)))
+                elif in_other:
+                    output["restarts"] += 1
+            elif depth == 1 and field in RESULT_FIELDS:
+                output[field] = loads(token)
+            elif in_other and containers[-1] == "[":
+                output["restarts"] += 1
+    output["timestamps"] = frombuffer(timestamps, dtype=int64).copy()
+    output["timestamps"].sort()
+    return output
+
+
+def map_result_file(path: Path, streaming: bool = False) -> QueryAggregate:
+    data = read_result_file_streaming(path) if streaming else read_result_file(path)
+    name, id = data["engine_query"].split("/queries/")[-1].split(".sparql#")
+    scalars: Dict[str, int] = {
+        "time": round(float(data["time_taken_seconds"]) * 1000),
+        "results": data["result_count"],
+        "httpRequests": data["requested_urls_count"],
+        "restarts": data["restarts"],
+    }
+    return QueryAggregate(
+        name=name,
+        id=id,
+        scalars=scalars,
+        timeout=data["engine_timeout_reached"],
+        timestamps=data["timestamps"],
+    )
+
+
+def merge_aggregates(
+    aggregates: Iterable[QueryAggregate],
+) -> Dict[Tuple[str, str], Dict[str, Any]] | None:
+    merged: Dict[Tuple[str, str], QueryAggregate] = {}
+    for aggregate in aggregates:
+        key = (aggregate.name, aggregate.id)
+        if key in merged:
+            merged[key].merge(aggregate)
+        else:
+            merged[key] = aggregate
+    output: Dict[Tuple[str, str], Dict[str, Any]] = {
+        key: merged[key].to_row()
+        for key in sorted(merged.keys(), key=lambda k: natural_sort_key("-".join(k)))
+    }
     return output if len(output) > 0 else None
 
 
+def is_result_file(name: str) -> bool:
+    # hidden files are skipped, as they include the manifest of the output
+    return name.endswith(".json") and not name.startswith(".")
+
+
 def serialize_processed(data: Dict[str, Dict[str, Any]], path: Path) -> None:
     columns: List[str] = [
         "name",
@@ -159,7 +262,7 @@ def serialize_processed(data: Dict[str, Dict[str, Any]], path: Path) -> None:
                 )
                 + "\n"
             )
-    print(f"Wrote: {path}")
+    info(f"Wrote: {path}")
 
 
 def split_by_config(unprocessed: Path) -> None:
@@ -175,21 +278,103 @@ def split_by_config(unprocessed: Path) -> None:
             result.rename(target_path.joinpath(result.name))
 
 
-def process_all() -> None:
-    results_path: Path = Path(__file__).parent.parent.joinpath("results").resolve()
-    for results in results_path.iterdir():
+def get_manifest_path(csv_path: Path) -> Path:
+    return csv_path.with_name(f".{csv_path.name}.manifest.json")
+
+
+def get_inputs(path: Path) -> Dict[str, Dict[str, int]]:
+    inputs: Dict[str, Dict[str, int]] = {}
+    for fp in scandir(path):
+        if is_result_file(fp.name) and fp.is_file():
+            stats = fp.stat()
+            inputs[fp.name] = {"size": stats.st_size, "mtime": stats.st_mtime_ns}
+    return dict(sorted(inputs.items()))
+
+
+def write_manifest(path: Path, inputs: Dict[str, Dict[str, Any]]) -> None:
+    for name, entry in inputs.items():
+        if "hash" not in entry:
+            entry["hash"] = get_file_hash(path.joinpath(name))
+    manifest_path = get_manifest_path(path.joinpath(OUTPUT_NAME))
+    with open(manifest_path, "w") as manifest_file:
+        dump({"version": MANIFEST_VERSION, "inputs": inputs}, manifest_file, indent=2)
+
+
+def is_up_to_date(path: Path, inputs: Dict[str, Dict[str, int]]) -> bool:
+    manifest_path = get_manifest_path(path.joinpath(OUTPUT_NAME))
+    if not manifest_path.is_file() or not path.joinpath(OUTPUT_NAME).is_file():
+        return False
+    try:
+        with open(manifest_path, "r") as manifest_file:
+            manifest: Dict[str, Any] = loads(manifest_file.read())
+    except (OSError, ValueError):
+        return False
+    recorded: Dict[str, Dict[str, Any]] = manifest.get("inputs", {})
+    if manifest.get("version") != MANIFEST_VERSION or recorded.keys() != inputs.keys():
+        return False
+    touched = False
+    for name, entry in recorded.items():
+        size, mtime = inputs[name]["size"], inputs[name]["mtime"]
+        if not is_file_unchanged(path.joinpath(name), entry, size, mtime):
+            return False
+        if entry["mtime"] != mtime:
+            entry["mtime"] = mtime
+            touched = True
+    if touched:
+        write_manifest(path, recorded)
+    return True
+
+
+def serialize_all(
+    tasks: List[Tuple[Path, Path]],
+    aggregates: Iterable[QueryAggregate],
+    inputs: Dict[Path, Dict[str, Dict[str, Any]]],
+) -> None:
+    # the tasks are ordered by config, so each config can be merged once complete
+    for config_results, group in groupby(zip(tasks, aggregates), key=lambda t: t[0][0]):
+        processed = merge_aggregates(aggregate for _, aggregate in group)
+        if processed:
+            serialize_processed(processed, config_results.joinpath(OUTPUT_NAME))
+            write_manifest(config_results, inputs[config_results])
+
+
+def process_all(
+    results_path: Path,
+    workers: int = 1,
+    streaming: bool = False,
+    force: bool = False,
+) -> None:
+    tasks: List[Tuple[Path, Path]] = []
+    inputs: Dict[Path, Dict[str, Dict[str, Any]]] = {}
+    for results in sorted(results_path.resolve().iterdir()):
         # unprocessed: Path = results.joinpath("unprocessed")
         # if unprocessed.exists():
         #    split_by_config(unprocessed)
         if results.is_dir():
-            for config_results in results.iterdir():
+            for config_results in sorted(results.iterdir()):
                 if config_results.is_dir():
-                    processed = process_from_path(config_results)
-                    if processed:
-                        serialize_processed(
-                            processed, config_results.joinpath("query-times.csv")
-                        )
+                    config_inputs = get_inputs(config_results)
+                    if not force and is_up_to_date(config_results, config_inputs):
+                        debug(f"Skipping unchanged {config_results}")
+                        continue
+                    inputs[config_results] = config_inputs
+                    for name in config_inputs.keys():
+                        tasks.append((config_results, config_results.joinpath(name)))
+    info(f"Processing {len(tasks)} result files from {len(inputs)} changed configs")
+    result_files = [result_file for _, result_file in tasks]
+    map_function = partial(map_result_file, streaming=streaming)
+    if workers < 2 or len(tasks) < 2:
+        serialize_all(tasks, map(map_function, result_files), inputs)
+    else:
+        # the files of all configs are mapped in one pool, in chunks to limit overhead
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(tasks) // (workers * 4))
+            serialize_all(
+                tasks,
+                executor.map(map_function, result_files, chunksize=chunksize),
+                inputs,
+            )
 
 
-def run_script() -> None:
-    process_all()
+def run_script(results: Path, workers: int, streaming: bool, force: bool) -> None:
+    process_all(results, workers, streaming, force)
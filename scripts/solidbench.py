@@ -1,9 +1,21 @@
-from typing import Dict
+from os import cpu_count
+from time import perf_counter
+from typing import Any, Dict, Iterable, List, Set, Tuple
 from pathlib import Path
-from rdflib import Graph
 from yaml import dump
-from logging import info, debug
+from logging import info
 from argparse import ArgumentParser
+from functools import partial
+from sqlite3 import Connection
+from concurrent.futures import ProcessPoolExecutor
+
+from utilities.nquads import iter_document
+from utilities.quadindex import get_pods, read_index
+from utilities.sketches import ExactSet, HyperLogLog, SpaceSaving, get_distinct_counter
+from utilities.walker import list_directories, walk_files
+
+# the predicate counters kept per top predicate, to bound the error of the top ones
+PREDICATE_CAPACITY_FACTOR = 10
 
 
 def register_args(parser: ArgumentParser) -> None:
@@ -25,51 +37,269 @@ def register_args(parser: ArgumentParser) -> None:
         help="Comma-separated list of extensions to parse as RDF",
         default=".nq",
     )
+    parser.add_argument(
+        "--workers",
+        help="Number of processes to calculate the pod metrics with",
+        default=cpu_count(),
+        type=int,
+    )
+    parser.add_argument(
+        "--sketch-error",
+        help="Relative standard error of the distinct term counts",
+        default=0.01,
+        type=float,
+    )
+    parser.add_argument(
+        "--exact",
+        help="Count the distinct terms and predicates exactly, for small datasets",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--top-predicates",
+        help="Number of most frequent predicates to report",
+        default=20,
+        type=int,
+    )
+    parser.add_argument(
+        "--index",
+        help="Path to a quad index to calculate exact metrics from instead of files"
+        ", counting the predicates of distinct statements",
+        type=Path,
+    )
 
 
-def run_script(pods: Path, output: Path, extensions: str) -> None:
-    info(f"Calculating metrics for {pods}")
+class DatasetStatistics:
+    files: int
+    triples: int
+    bytes: int
+    subjects: HyperLogLog | ExactSet
+    predicates: HyperLogLog | ExactSet
+    objects: HyperLogLog | ExactSet
+    graphs: HyperLogLog | ExactSet
+    predicate_counts: SpaceSaving
+
+    def __init__(self, error: float, exact: bool, top_predicates: int) -> None:
+        self.files = 0
+        self.triples = 0
+        self.bytes = 0
+        self.subjects = get_distinct_counter(error, exact)
+        self.predicates = get_distinct_counter(error, exact)
+        self.objects = get_distinct_counter(error, exact)
+        self.graphs = get_distinct_counter(error, exact)
+        self.predicate_counts = SpaceSaving(
+            None if exact else top_predicates * PREDICATE_CAPACITY_FACTOR
+        )
 
-    rdf_ext = set(extensions.split(","))
-    pod_metrics: Dict[Path, Dict[str, int]] = {}
-    total_triples = 0
-    total_files = 0
-
-    for pod in pods.iterdir():
-        info(f"Processing pod {pod}")
-        path_queue = set(pod.iterdir())
-        file_count = 0
-        triple_count = 0
-        while path_queue:
-            path = path_queue.pop()
-            if path.is_dir():
-                path_queue.update(path.iterdir())
-            elif path.is_file() and any(path.name.endswith(ext) for ext in rdf_ext):
-                data = Graph()
-                data.parse(path)
-                triple_count += len(data)
-                file_count += 1
+    def add_document(self, path: Path, size: int) -> None:
+        triples: Set[Tuple[str, str, str]] = set()
+        subjects: Set[str] = set()
+        objects: Set[str] = set()
+        graphs: Set[str] = set()
+        predicate_counts: Dict[str, int] = {}
+        for s, p, o, g in iter_document(path):
+            subjects.add(s)
+            objects.add(o)
+            predicate_counts[p] = predicate_counts.get(p, 0) + 1
+            if g is None:
+                triples.add((s, p, o))
             else:
-                debug(f"Skipping: {path}")
-        total_files += file_count
-        total_triples += triple_count
-        pod_metrics[pod.as_posix()] = {
-            "files": file_count,
-            "triples": triple_count,
+                graphs.add(g)
+        # the terms are deduplicated per document before they reach the sketches
+        self.files += 1
+        self.triples += len(triples)
+        self.bytes += size
+        self.subjects.update(subjects)
+        self.predicates.update(predicate_counts.keys())
+        self.objects.update(objects)
+        self.graphs.update(graphs)
+        self.predicate_counts.update(predicate_counts)
+
+    def merge(self, other: "DatasetStatistics") -> "DatasetStatistics":
+        self.files += other.files
+        self.triples += other.triples
+        self.bytes += other.bytes
+        self.subjects.merge(other.subjects)
+        self.predicates.merge(other.predicates)
+        self.objects.merge(other.objects)
+        self.graphs.merge(other.graphs)
+        self.predicate_counts.merge(other.predicate_counts)
+        return self
+
+    def to_metrics(self, top_predicates: int) -> Dict[str, Any]:
+        return {
+            "files": self.files,
+            "triples": self.triples,
+            "bytes": self.bytes,
+            "bytes_per_document": round(self.bytes / self.files) if self.files else 0,
+            "distinct_subjects": self.subjects.count(),
+            "distinct_predicates": self.predicates.count(),
+            "distinct_objects": self.objects.count(),
+            "distinct_graphs": self.graphs.count(),
+            # a list of single mappings, to keep the predicates in frequency order
+            "predicates": [
+                {p: c} for p, c in self.predicate_counts.top(top_predicates)
+            ],
+        }
+
+
+def get_pod_statistics(
+    pod: Path,
+    extensions: Set[str],
+    error: float,
+    exact: bool,
+    top_predicates: int,
+) -> Tuple[DatasetStatistics, float]:
+    start = perf_counter()
+    statistics = DatasetStatistics(error, exact, top_predicates)
+    for batch in walk_files(pod, extensions):
+        for entry in batch:
+            statistics.add_document(Path(entry.path), entry.size)
+    return statistics, perf_counter() - start
+
+
+def merge_pod_metrics(
+    pods: Path,
+    pod_paths: List[Path],
+    results: Iterable[Tuple[DatasetStatistics, float]],
+    total: DatasetStatistics,
+    top_predicates: int,
+) -> Dict[str, Dict[str, Any]]:
+    pod_metrics: Dict[str, Dict[str, Any]] = {}
+    for pod, (statistics, duration) in zip(pod_paths, results):
+        info(
+            f"Processed pod {pod} with {statistics.files} files and"
+            f" {statistics.triples} triples in {duration:.2f} s"
+        )
+        pod_metrics[pod.as_posix()] = statistics.to_metrics(top_predicates)
+        total.merge(statistics)
+    return {
+        pods.as_posix(): {"pods": len(pod_paths), **total.to_metrics(top_predicates)},
+        **pod_metrics,
+    }
+
+
+def get_index_metrics(
+    connection: Connection, pod_id: int | None, top_predicates: int
+) -> Dict[str, Any]:
+    # the same metrics as the exact statistics, from the pod or the whole index
+    pod_filter = "" if pod_id is None else " WHERE pod = :pod"
+    # the join order makes SQLite read the quads of the pod by document
+    quad_filter = (
+        " quads"
+        if pod_id is None
+        else " documents CROSS JOIN quads ON quads.document = documents.id"
+        " WHERE documents.pod = :pod"
+    )
+    parameters = {"pod": pod_id, "top": top_predicates}
+    files, size, triples = connection.execute(
+        "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(triples), 0)"
+        f" FROM documents{pod_filter}",
+        parameters,
+    ).fetchone()
+    subjects, predicates, objects, graphs = connection.execute(
+        "SELECT COUNT(DISTINCT quads.s), COUNT(DISTINCT quads.p),"
+        " COUNT(DISTINCT quads.o), COUNT(DISTINCT quads.g)"
+        f" FROM{quad_filter}",
+        parameters,
+    ).fetchone()
+    predicate_counts = connection.execute(
+        "SELECT terms.term, counts.count FROM (SELECT quads.p, COUNT(*) AS count"
+        f" FROM{quad_filter} GROUP BY quads.p) AS counts"
+        " JOIN terms ON terms.id = counts.p"
+        " ORDER BY counts.count DESC, terms.term LIMIT :top",
+        parameters,
+    ).fetchall()
+    return {
+        "files": files,
+        "triples": triples,
+        "bytes": size,
+        "bytes_per_document": round(size / files) if files else 0,
+        "distinct_subjects": subjects,
+        "distinct_predicates": predicates,
+        "distinct_objects": objects,
+        "distinct_graphs": graphs,
+        "predicates": [{p: c} for p, c in predicate_counts],
+    }
+
+
+def get_all_index_metrics(
+    pods: Path, index: Path, top_predicates: int
+) -> Dict[str, Dict[str, Any]]:
+    connection = read_index(index)
+    try:
+        pod_ids = get_pods(connection)
+        pod_metrics: Dict[str, Dict[str, Any]] = {
+            pods.as_posix(): {
+                "pods": len(pod_ids),
+                **get_index_metrics(connection, None, top_predicates),
+            }
         }
+        for pod_id, name in pod_ids:
+            start = perf_counter()
+            pod = pods.joinpath(name)
+            pod_metrics[pod.as_posix()] = get_index_metrics(
+                connection, pod_id, top_predicates
+            )
+            info(f"Processed pod {pod} from {index} in {perf_counter() - start:.2f} s")
+    finally:
+        connection.close()
+    return pod_metrics
+
+
+def get_all_pod_metrics(
+    pods: Path,
+    extensions: Set[str],
+    workers: int,
+    sketch_error: float,
+    exact: bool,
+    top_predicates: int,
+) -> Dict[str, Dict[str, Any]]:
+    pod_paths = list_directories(pods)
+    map_function = partial(
+        get_pod_statistics,
+        extensions=extensions,
+        error=sketch_error,
+        exact=exact,
+        top_predicates=top_predicates,
+    )
+    total = DatasetStatistics(sketch_error, exact, top_predicates)
+
+    if workers < 2 or len(pod_paths) < 2:
+        results = map(map_function, pod_paths)
+        return merge_pod_metrics(pods, pod_paths, results, total, top_predicates)
+
+    # the pods are independent, so each one is counted by a single worker
+    info(f"Processing {len(pod_paths)} pods using {workers} workers")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(map_function, pod_paths)
+        return merge_pod_metrics(pods, pod_paths, results, total, top_predicates)
+
+
+def run_script(
+    pods: Path,
+    output: Path,
+    extensions: str,
+    workers: int = 1,
+    sketch_error: float = 0.01,
+    exact: bool = False,
+    top_predicates: int = 20,
+    index: Path | None = None,
+) -> None:
+    info(f"Calculating metrics for {pods}")
+
+    if index:
+        pod_metrics = get_all_index_metrics(pods, index, top_predicates)
+    else:
+        pod_metrics = get_all_pod_metrics(
+            pods,
+            set(extensions.split(",")),
+            workers,
+            sketch_error,
+            exact,
+            top_predicates,
+        )
 
     info(f"Dumping metrics to {output}")
 
     with open(output, "w") as output_file:
-        dump(
-            {
-                pods.as_posix(): {
-                    "pods": len(pod_metrics),
-                    "files": total_files,
-                    "triples": total_triples,
-                },
-                **pod_metrics,
-            },
-            stream=output_file,
-            allow_unicode=True,
-        )
+        dump(pod_metrics, stream=output_file, allow_unicode=True)
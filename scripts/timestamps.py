@@ -1,20 +1,52 @@
+from os import cpu_count, replace
 from pathlib import Path
-from typing import Dict, List
+from hashlib import blake2b
+from typing import Dict, List, Tuple
 from math import sqrt, ceil, floor
-from numpy import arange, ndarray
+from numpy import (
+    arange,
+    asarray,
+    column_stack,
+    concatenate,
+    diff,
+    flatnonzero,
+    ndarray,
+    repeat,
+    uint8,
+    union1d,
+    zeros,
+)
 from argparse import ArgumentParser
-from logging import info
-from matplotlib import rcParams
+from logging import debug, info, warning
+from matplotlib import colormaps, rcParams, __version__ as matplotlib_version
 from matplotlib.axes import Axes
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.lines import Line2D
 from matplotlib.ticker import MaxNLocator
 from matplotlib.figure import Figure
-from matplotlib.pyplot import figure, get_cmap
+from matplotlib.image import imsave
+from PIL import Image
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_pdf import PdfPages
+from concurrent.futures import ProcessPoolExecutor
 
-from utilities.result import load_results, group_by_query, Result
+from utilities.result import load_results, group_by_query, Result, ResultTable
 from utilities.sorting import natural_sort_key
+from utilities.walker import iter_window
 
 COLUMN_INCHES = 4
 ROW_INCHES = 3
+ORIGIN = zeros(1)
+
+# the rendered subplots are cached as images in the experiments directory, and
+# only used for the image formats that the subplots can be composed into
+PANEL_CACHE_NAME = ".panels"
+PANEL_CACHE_VERSION = 1
+RASTER_FORMATS = set(("png", "jpg", "jpeg", "tif", "tiff", "webp"))
+
+# serif by default, as when importing every script at startup set it through plot.py
+rcParams["font.family"] = "serif"
+rcParams["mathtext.fontset"] = "dejavuserif"
 
 
 def register_args(parser: ArgumentParser) -> None:
@@ -33,7 +65,7 @@ def register_args(parser: ArgumentParser) -> None:
     )
     parser.add_argument(
         "--serif",
-        help="Use serif fonts in the plot",
+        help="Use serif fonts in the plot, which is also the default",
         action="store_true",
     )
     parser.add_argument(
@@ -58,96 +90,416 @@ def register_args(parser: ArgumentParser) -> None:
         default=300,
         type=int,
     )
+    parser.add_argument(
+        "--workers",
+        help="Number of processes to load the experiments and plot the pages with",
+        default=cpu_count(),
+        type=int,
+    )
+    parser.add_argument(
+        "--no-cache",
+        help="Parse the results and plot them without using or updating the caches",
+        dest="cache",
+        action="store_false",
+    )
+    parser.add_argument(
+        "--page-size",
+        help="Plot pages of this many queries as separate figures, 0 for one figure",
+        default=0,
+        type=int,
+    )
+    parser.add_argument(
+        "--format",
+        help="The image format of the pages, when the output is a directory",
+        dest="image_format",
+        default="png",
+        type=str,
+    )
 
 
 def get_colors(configs: List[str], colormap: str) -> Dict[str, ndarray]:
-    cmap = get_cmap(colormap)
+    cmap = colormaps[colormap]
     config_count = len(configs)
     cmap = cmap.resampled(config_count)
     colors = cmap(arange(0, config_count, 1))
     return {configs[i]: colors[i] for i in range(0, cmap.N)}
 
 
+def get_bucket_bounds(x: ndarray, buckets: int) -> ndarray:
+    # the first and last index in every bucket of a non-decreasing series
+    upper = x[-1] if x[-1] > 0 else 1
+    bucket = (x * (buckets / upper)).astype(int).clip(max=buckets - 1)
+    starts = flatnonzero(diff(bucket, prepend=-1))
+    return union1d(starts, concatenate((starts[1:] - 1, [len(x) - 1])))
+
+
+def get_sample_indices(series: List[ndarray], buckets: int) -> ndarray:
+    # keep the first and last point of every pixel-wide bucket
+    length = len(series[0])
+    if length <= 2 * buckets:
+        return arange(length)
+    indices = get_bucket_bounds(series[0], buckets)
+    for x in series[1:]:
+        indices = union1d(indices, get_bucket_bounds(x, buckets))
+    return indices
+
+
+def get_legend_handles(colors: Dict[str, ndarray]) -> List[Line2D]:
+    # the same legend for every page, including the configs missing from it
+    return [
+        Line2D([], [], lw=1, alpha=0.8, color=colors[config], label=config)
+        for config in sorted(colors, key=natural_sort_key)
+    ]
+
+
+def get_step_vertices(x: ndarray, y: ndarray) -> ndarray:
+    # the corners of a step line that changes at every x, like step with post
+    return column_stack((repeat(x, 2)[1:], repeat(y, 2)[:-1]))
+
+
+def get_band_vertices(y: ndarray, x_min: ndarray, x_max: ndarray) -> ndarray:
+    # the outline of the area between x_min and x_max, like fill_betweenx
+    return column_stack((concatenate((x_min, x_max[::-1])), concatenate((y, y[::-1]))))
+
+
+def plot_query(
+    ax: Axes,
+    query: str,
+    query_results: List[Result],
+    steps: bool,
+    colors: Dict[str, ndarray],
+    buckets: int,
+) -> None:
+    # draw curves, bands and markers as one collection each
+    ax.set_title(query)
+    query_colors = [colors[r.experiment] for r in query_results]
+    lines: List[ndarray] = []
+    bands: List[ndarray] = []
+    for result in query_results:
+        # the result count will have (0, 0) added to the beginning
+        plot_x = concatenate((ORIGIN, result.timestamps))
+        plot_y = arange(0, result.results_max + 1)
+        if steps:
+            indices = get_sample_indices([plot_x], buckets)
+            lines.append(get_step_vertices(plot_x[indices], plot_y[indices]))
+        else:
+            plot_x_min = concatenate((ORIGIN, result.timestamps_min))
+            plot_x_max = concatenate((ORIGIN, result.timestamps_max))
+            indices = get_sample_indices([plot_x, plot_x_min, plot_x_max], buckets)
+            lines.append(column_stack((plot_x[indices], plot_y[indices])))
+            bands.append(
+                get_band_vertices(
+                    plot_y[indices], plot_x_min[indices], plot_x_max[indices]
+                )
+            )
+    # the bands stay below the lines and markers, as with the artists per result
+    if bands:
+        ax.add_collection(
+            PolyCollection(
+                bands,
+                facecolors=query_colors,
+                edgecolors=query_colors,
+                alpha=0.2,
+            )
+        )
+    ax.add_collection(
+        LineCollection(lines, colors=query_colors, linewidths=1, alpha=0.8, zorder=2)
+    )
+    ax.scatter(
+        [r.time for r in query_results],
+        [r.results_max for r in query_results],
+        s=rcParams["lines.markersize"] ** 2,
+        c=query_colors,
+        marker="x",
+        linewidths=rcParams["lines.markeredgewidth"],
+        zorder=2,
+    )
+    ax.autoscale_view()
+    ax_xbound_upper = int(ax.get_xbound()[1] + 1)
+    ax_ybound_upper = int(ax.get_ybound()[1] + 1)
+    ax.set_xbound(lower=0, upper=ax_xbound_upper)
+    ax.set_ybound(lower=0, upper=ax_ybound_upper)
+    ax.set_xlabel("time [s]")
+    ax.set_ylabel("# results")
+    ax.xaxis.grid(visible=True, alpha=0.5)
+    ax.yaxis.grid(visible=True, alpha=0.5)
+    ax.xaxis.set_major_locator(MaxNLocator(integer=True))
+    ax.yaxis.set_major_locator(MaxNLocator(integer=True))
+
+
+def get_sorted_results(
+    results: Dict[str, List[Result]],
+) -> List[Tuple[str, List[Result]]]:
+    # the queries by name, and the results of each by the configuration they used
+    return [
+        (query, sorted(query_results, key=lambda r: natural_sort_key(r.experiment)))
+        for query, query_results in sorted(
+            results.items(), key=lambda i: natural_sort_key(i[0])
+        )
+    ]
+
+
+def add_legend(
+    fig: Figure,
+    cols: int,
+    colors: Dict[str, ndarray],
+    last_results: List[Result],
+    legend_handles: List[Line2D] | None,
+) -> None:
+    if legend_handles is None:
+        # the legend of the last subplot, as it was drawn
+        legend_handles = get_legend_handles(
+            dict((r.experiment, colors[r.experiment]) for r in last_results)
+        )
+    fig.legend(
+        handles=legend_handles,
+        labels=[h.get_label() for h in legend_handles],
+        bbox_to_anchor=(0.8, 0.1),
+        loc="lower center",
+        ncols=cols,
+        # frameon=False,
+    )
+
+
 def plot_timestamps(
     results: Dict[str, List[Result]],
     steps: bool,
     colors: Dict[str, ndarray],
     dpi: int,
+    legend_handles: List[Line2D] | None = None,
 ) -> Figure:
-    fig: Figure = figure(dpi=dpi)
+    fig = Figure(dpi=dpi)
+    FigureCanvasAgg(fig)
     rows: int = floor(sqrt(len(results)))
     cols: int = ceil(len(results) / rows)
     info(f"Plotting into {cols} x {rows} grid")
-    subplot_index: int = 0
-    # results are grouped by query -> sort them by the query name
-    sorted_query_results = sorted(results.items(), key=lambda i: natural_sort_key(i[0]))
-    for query, query_results in sorted_query_results:
-        subplot_index += 1
+    # at most two points per pixel column of a subplot are visible
+    buckets = COLUMN_INCHES * dpi
+    sorted_results = get_sorted_results(results)
+    for subplot_index, (query, query_results) in enumerate(sorted_results, start=1):
         ax: Axes = fig.add_subplot(rows, cols, subplot_index)
-        ax.set_title(query)
-        # sort the different results by the configuration they used
-        for result in sorted(
-            query_results, key=lambda r: natural_sort_key(r.experiment)
-        ):
-            plot_x = [0, *result.timestamps]
-            plot_y = range(0, result.results_max + 1)
-            # the result count will have (0, 0) added to the beginning
-            if steps:
-                ax.step(
-                    plot_x,
-                    plot_y,
-                    lw=1,
-                    alpha=0.8,
-                    label=result.experiment,
-                    color=colors[result.experiment],
-                    where="post",
-                )
-            else:
-                ax.plot(
-                    plot_x,
-                    plot_y,
-                    lw=1,
-                    alpha=0.8,
-                    label=result.experiment,
-                    color=colors[result.experiment],
-                )
-                ax.fill_betweenx(
-                    plot_y,
-                    [0, *result.timestamps_min],
-                    [0, *result.timestamps_max],
-                    alpha=0.2,
-                    color=colors[result.experiment],
-                )
-            ax.plot(
-                result.time,
-                result.results_max,
-                color=colors[result.experiment],
-                marker="x",
-            )
-        ax_xbound_upper = int(ax.get_xbound()[1] + 1)
-        ax_ybound_upper = int(ax.get_ybound()[1] + 1)
-        ax.set_xbound(lower=0, upper=ax_xbound_upper)
-        ax.set_ybound(lower=0, upper=ax_ybound_upper)
-        ax.set_xlabel("time [s]")
-        ax.set_ylabel("# results")
-        ax.xaxis.grid(visible=True, alpha=0.5)
-        ax.yaxis.grid(visible=True, alpha=0.5)
-        ax.xaxis.set_major_locator(MaxNLocator(integer=True))
-        ax.yaxis.set_major_locator(MaxNLocator(integer=True))
-        handles, labels = ax.get_legend_handles_labels()
-    lgd = fig.legend(
-        handles=handles,
-        labels=labels,
-        bbox_to_anchor=(0.8, 0.1),
-        loc="lower center",
-        ncols=cols,
-        # frameon=False,
-    )
+        plot_query(ax, query, query_results, steps, colors, buckets)
+    add_legend(fig, cols, colors, sorted_results[-1][1], legend_handles)
     fig.set_size_inches(cols * COLUMN_INCHES, rows * ROW_INCHES)
     fig.tight_layout(pad=1)
     return fig
 
 
+def get_panel_key(
+    query: str,
+    query_results: List[Result],
+    steps: bool,
+    colors: Dict[str, ndarray],
+    dpi: int,
+    transparent: bool,
+) -> str:
+    # fingerprint of everything a rendered subplot depends on
+    digest = blake2b(digest_size=16)
+    style = (
+        PANEL_CACHE_VERSION,
+        matplotlib_version,
+        rcParams["font.family"],
+        rcParams["mathtext.fontset"],
+    )
+    digest.update(repr((*style, query, steps, dpi, transparent)).encode())
+    for result in query_results:
+        digest.update(
+            repr((result.experiment, result.time, result.results_max)).encode()
+        )
+        digest.update(colors[result.experiment].tobytes())
+        for timestamps in (
+            result.timestamps,
+            result.timestamps_min,
+            result.timestamps_max,
+        ):
+            digest.update(len(timestamps).to_bytes(8, "big"))
+            digest.update(timestamps.tobytes())
+    return digest.hexdigest()
+
+
+def render_panel(
+    query: str,
+    query_results: List[Result],
+    steps: bool,
+    colors: Dict[str, ndarray],
+    dpi: int,
+    transparent: bool,
+) -> ndarray:
+    # a single subplot with the same size and padding as in the whole grid
+    fig = Figure(figsize=(COLUMN_INCHES, ROW_INCHES), dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    ax: Axes = fig.add_subplot()
+    plot_query(ax, query, query_results, steps, colors, COLUMN_INCHES * dpi)
+    if transparent:
+        fig.patch.set_alpha(0)
+        ax.patch.set_alpha(0)
+    fig.tight_layout(pad=1)
+    canvas.draw()
+    return asarray(canvas.buffer_rgba()).copy()
+
+
+def load_panel(path: Path) -> ndarray | None:
+    if not path.is_file():
+        return None
+    try:
+        with Image.open(path) as panel:
+            return asarray(panel.convert("RGBA"))
+    except Exception as ex:
+        debug(f"Unable to read cached panel {path}: {ex}")
+        return None
+
+
+def save_panel(path: Path, panel: ndarray) -> None:
+    temporary_path = path.with_name(f"{path.name}.tmp")
+    try:
+        imsave(temporary_path, panel, format="png")
+        replace(temporary_path, path)
+    except OSError as ex:
+        warning(f"Unable to write cached panel {path}: {ex}")
+
+
+def plot_cached_timestamps(
+    results: Dict[str, List[Result]],
+    steps: bool,
+    colors: Dict[str, ndarray],
+    dpi: int,
+    transparent: bool,
+    cache_path: Path,
+    legend_handles: List[Line2D] | None = None,
+) -> Figure:
+    # plot_timestamps as an image composed of cached subplots
+    rows: int = floor(sqrt(len(results)))
+    cols: int = ceil(len(results) / rows)
+    width = COLUMN_INCHES * dpi
+    height = ROW_INCHES * dpi
+    try:
+        cache_path.mkdir(parents=True, exist_ok=True)
+    except OSError as ex:
+        warning(f"Unable to create panel cache {cache_path}: {ex}")
+        return plot_timestamps(results, steps, colors, dpi, legend_handles)
+    info(f"Composing {cols} x {rows} grid from panels in {cache_path}")
+    # the panels are composed as the 8-bit RGBA pixels that are cached
+    image = zeros((rows * height, cols * width, 4), dtype=uint8)
+    sorted_results = get_sorted_results(results)
+    rendered = 0
+    for index, (query, query_results) in enumerate(sorted_results):
+        key = get_panel_key(query, query_results, steps, colors, dpi, transparent)
+        panel_path = cache_path.joinpath(f"{key}.png")
+        panel = load_panel(panel_path)
+        if panel is None or panel.shape != (height, width, 4):
+            panel = render_panel(query, query_results, steps, colors, dpi, transparent)
+            save_panel(panel_path, panel)
+            rendered += 1
+        top = index // cols * height
+        left = index % cols * width
+        image[top:][:height, left:][:, :width] = panel
+    info(f"Rendered {rendered} of {len(sorted_results)} panels, reusing the others")
+    fig = Figure(figsize=(cols * COLUMN_INCHES, rows * ROW_INCHES), dpi=dpi)
+    FigureCanvasAgg(fig)
+    fig.figimage(image, origin="upper")
+    add_legend(fig, cols, colors, sorted_results[-1][1], legend_handles)
+    return fig
+
+
+def get_pages(table: ResultTable, page_size: int) -> List[Tuple[str, ResultTable]]:
+    # pages of at most page_size queries, each with only its own rows
+    results = group_by_query(table)
+    queries = sorted(results, key=natural_sort_key)
+    pages: List[Tuple[str, ResultTable]] = []
+    for start in range(0, len(queries), page_size):
+        end = start + page_size
+        page_queries = queries[start:end]
+        rows = [r.index for q in page_queries for r in results[q]]
+        pages.append((page_queries[0], table.select(rows)))
+    return pages
+
+
+def plot_page(
+    table: ResultTable,
+    steps: bool,
+    colors: Dict[str, ndarray],
+    dpi: int,
+    serif: bool,
+    transparent: bool,
+    cache_path: Path | None,
+) -> Figure:
+    # the font settings do not carry over to the worker processes
+    if serif:
+        rcParams["font.family"] = "serif"
+        rcParams["mathtext.fontset"] = "dejavuserif"
+    results = group_by_query(table)
+    legend_handles = get_legend_handles(colors)
+    if cache_path is None:
+        return plot_timestamps(results, steps, colors, dpi, legend_handles)
+    return plot_cached_timestamps(
+        results, steps, colors, dpi, transparent, cache_path, legend_handles
+    )
+
+
+def save_page(
+    output: Path,
+    table: ResultTable,
+    steps: bool,
+    colors: Dict[str, ndarray],
+    dpi: int,
+    serif: bool,
+    transparent: bool,
+    cache_path: Path | None,
+) -> None:
+    fig = plot_page(table, steps, colors, dpi, serif, transparent, cache_path)
+    fig.savefig(output, transparent=transparent)
+
+
+def plot_pages(
+    table: ResultTable,
+    output: Path,
+    steps: bool,
+    colors: Dict[str, ndarray],
+    dpi: int,
+    serif: bool,
+    transparent: bool,
+    image_format: str,
+    page_size: int,
+    workers: int,
+    cache_path: Path | None,
+) -> None:
+    pages = get_pages(table, page_size)
+    info(f"Plotting {len(pages)} pages of {page_size} queries to {output.absolute()}")
+    if output.suffix == ".pdf":
+        # the pages of a document are drawn into it here, so they are not parallel
+        with PdfPages(output) as document:
+            for _, page in pages:
+                fig = plot_page(page, steps, colors, dpi, serif, transparent, None)
+                document.savefig(fig, transparent=transparent)
+        return
+    output.mkdir(parents=True, exist_ok=True)
+    if image_format.lower() not in RASTER_FORMATS:
+        cache_path = None
+    arguments = [
+        (
+            output.joinpath(f"{i:03d}-{query}.{image_format}"),
+            page,
+            steps,
+            colors,
+            dpi,
+            serif,
+            transparent,
+            cache_path,
+        )
+        for i, (query, page) in enumerate(pages, start=1)
+    ]
+    workers = min(workers, len(pages))
+    if workers < 2:
+        for page_arguments in arguments:
+            save_page(*page_arguments)
+    else:
+        debug(f"Plotting {len(pages)} pages using {workers} workers")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # the images are saved by the workers, at most two pages each ahead
+            for _ in iter_window(executor, save_page, arguments, 2 * workers):
+                pass
+
+
 def run_script(
     experiments: Path,
     output: Path,
@@ -156,17 +508,42 @@ def run_script(
     steps: bool,
     transparent: bool,
     dpi: int,
+    workers: int,
+    cache: bool,
+    page_size: int = 0,
+    image_format: str = "png",
 ) -> None:
     info(f"Loading results from {experiments.absolute()}")
-    results = load_results(experiments)
-    configs = list(set(r.experiment for r in results))
-    results = group_by_query(results)
+    table = load_results(experiments, workers=workers, cache=cache)
+    configs = sorted(set(r.experiment for r in table), key=natural_sort_key)
     colors = get_colors(configs, colormap)
     info(f"Using colormap {colormap} to get {len(colors)} unique colours")
+    cache_path = experiments.joinpath(PANEL_CACHE_NAME) if cache else None
+    if page_size > 0:
+        plot_pages(
+            table,
+            output,
+            steps,
+            colors,
+            dpi,
+            serif,
+            transparent,
+            image_format,
+            page_size,
+            workers,
+            cache_path,
+        )
+        return
+    results = group_by_query(table)
     if serif:
         rcParams["font.family"] = "serif"
         rcParams["mathtext.fontset"] = "dejavuserif"
     info(f"Plotting {len(results)} results at {dpi} dpi")
-    fig = plot_timestamps(results, steps, colors, dpi)
+    if cache_path is not None and output.suffix[1:].lower() in RASTER_FORMATS:
+        fig = plot_cached_timestamps(
+            results, steps, colors, dpi, transparent, cache_path
+        )
+    else:
+        fig = plot_timestamps(results, steps, colors, dpi)
     info(f"Saving figure to {output.absolute()}")
     fig.savefig(output, transparent=transparent)
@@ -1,12 +1,15 @@
 from os import scandir
+from sys import argv
+from ast import parse, literal_eval, FunctionDef, Assign, Attribute
 from pathlib import Path
-from typing import Dict
-from argparse import ArgumentParser, Namespace, _SubParsersAction
+from typing import Dict, List
+from argparse import ArgumentParser, Namespace
 from logging import DEBUG, INFO, ERROR, basicConfig, exception
 from importlib import import_module
 
 log_levels: Dict[str, int] = {"debug": DEBUG, "info": INFO, "error": ERROR}
 scripts_module = "scripts"
+script_functions = ("register_args", "run_script")
 
 
 class SparqlBenchmarkRecapNamespace(Namespace):
@@ -22,23 +25,49 @@ def setup_logging(level: str) -> None:
     )
 
 
-def load_scripts(subparsers: _SubParsersAction) -> Dict[str, callable]:
+def get_description(function: FunctionDef) -> str | None:
+    # the scripts assign their description as parser.description = "..."
+    for node in function.body:
+        if (
+            isinstance(node, Assign)
+            and len(node.targets) == 1
+            and isinstance(node.targets[0], Attribute)
+            and node.targets[0].attr == "description"
+        ):
+            try:
+                return literal_eval(node.value)
+            except ValueError:
+                return None
+    return None
+
+
+def discover_scripts() -> Dict[str, str | None]:
+    # the modules are only parsed here, so their dependencies are not imported
     path = Path(__file__).parent.joinpath(scripts_module)
-    scripts: Dict[str, callable] = {}
+    scripts: Dict[str, str | None] = {}
     for fp in scandir(path):
         if fp.name.endswith(".py"):
             module_name = fp.name.removesuffix(".py")
             try:
-                module = import_module(f"{scripts_module}.{module_name}")
-                if hasattr(module, "register_args") and hasattr(module, "run_script"):
-                    parser = subparsers.add_parser(module_name)
-                    getattr(module, "register_args")(parser)
-                    scripts[module_name] = getattr(module, "run_script")
+                with open(fp.path, "r") as module_file:
+                    tree = parse(module_file.read(), filename=fp.path)
+                functions = {
+                    node.name: node
+                    for node in tree.body
+                    if isinstance(node, FunctionDef)
+                }
+                if all(f in functions for f in script_functions):
+                    scripts[module_name] = get_description(functions["register_args"])
             except Exception as ex:
                 exception(ex)
     return scripts
 
 
+def get_selected_script(args: List[str], scripts: Dict[str, str | None]) -> str | None:
+    # only --logging and --help can precede the script, neither takes a script name
+    return next((arg for arg in args if arg in scripts), None)
+
+
 def run() -> None:
     parser = ArgumentParser(
         description=(
@@ -48,14 +77,25 @@ def run() -> None:
         allow_abbrev=False,
     )
     subparsers = parser.add_subparsers(dest="script")
-    scripts = load_scripts(subparsers)
+    scripts = discover_scripts()
+    selected = get_selected_script(argv[1:], scripts)
+    run_script: callable = None
+    for module_name, description in sorted(scripts.items()):
+        script_parser = subparsers.add_parser(module_name, help=description)
+        if module_name == selected:
+            try:
+                module = import_module(f"{scripts_module}.{module_name}")
+                getattr(module, "register_args")(script_parser)
+                run_script = getattr(module, "run_script")
+            except Exception as ex:
+                exception(ex)
     parser.add_argument("--logging", choices=log_levels.keys(), default="info")
     args: SparqlBenchmarkRecapNamespace = parser.parse_args()
     setup_logging(args.logging)
     if not args.script:
         parser.print_help()
-    else:
-        scripts[args.script](
+    elif run_script:
+        run_script(
             **{k: v for k, v in args._get_kwargs() if k not in ("script", "logging")}
         )
 
@@ -0,0 +1,31 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from utilities.nquads import count_triples, iter_statements
+
+
+class IterStatementsTest(TestCase):
+    def read(self, text: str) -> Path:
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = Path(directory.name).joinpath("document.nq")
+        path.write_text(text, encoding="utf-8")
+        return path
+
+    def test_last_line_without_line_break(self) -> None:
+        path = self.read('<a> <b> "c" .\n<a> <b> <d> <g> .')
+        self.assertEqual(
+            list(iter_statements(path)),
+            [("<a>", "<b>", '"c"', None), ("<a>", "<b>", "<d>", "<g>")],
+        )
+
+    def test_invalid_last_line_without_line_break(self) -> None:
+        path = self.read("<a> <b> <c> .\n<a> <b> invalid")
+        with self.assertRaisesRegex(ValueError, r"document\.nq:2$"):
+            count_triples(path)
+
+    def test_invalid_line(self) -> None:
+        path = self.read("<a> <b> <c> .\n<a> <b> invalid\n<a> <b> <d> .\n")
+        with self.assertRaisesRegex(ValueError, r"document\.nq:2$"):
+            count_triples(path)
@@ -0,0 +1,92 @@
+from typing import Tuple
+from numpy import (
+    ndarray,
+    arange,
+    asarray,
+    bincount,
+    broadcast_to,
+    diff,
+    float64,
+    int64,
+    nan,
+    repeat,
+    where,
+    zeros,
+)
+
+# The answer trace of a result is the number of answers produced over time.
+# For the step variant, the trace is a step function that increases by one at
+# every timestamp, and for the linear variant the trace is linearly interpolated
+# between (0, 0) and the points (t_i, i + 1), where t_i is the i-th timestamp.
+# The functions here operate on a flat buffer of sorted timestamps for many rows
+# at once, with offsets[r]:offsets[r + 1] delimiting the timestamps of row r.
+
+
+def get_segments(offsets: ndarray) -> Tuple[ndarray, ndarray, ndarray]:
+    lengths = diff(offsets)
+    rows = repeat(arange(len(lengths)), lengths)
+    positions = arange(offsets[-1]) - repeat(offsets[:-1], lengths)
+    return lengths, rows, positions
+
+
+def get_areas(timestamps: ndarray, positions: ndarray, linear: bool) -> ndarray:
+    # the area under the trace between each timestamp and the one before it
+    intervals = diff(timestamps, prepend=0.0)
+    intervals[positions == 0] = timestamps[positions == 0]
+    return intervals * (positions + (0.5 if linear else 0))
+
+
+def dief_at_k(
+    timestamps: ndarray,
+    offsets: ndarray,
+    k: ndarray | int | None = None,
+    linear: bool = False,
+) -> ndarray:
+    # area under the answer trace until the k-th answer, NaN with fewer answers
+    timestamps = asarray(timestamps, dtype=float64)
+    lengths, rows, positions = get_segments(asarray(offsets, dtype=int64))
+    k = lengths if k is None else broadcast_to(asarray(k, dtype=int64), lengths.shape)
+    mask = positions < k[rows]
+    values = bincount(
+        rows[mask],
+        weights=get_areas(timestamps, positions, linear)[mask],
+        minlength=len(lengths),
+    )
+    return where(lengths >= k, values, nan)
+
+
+def dief_at_t(
+    timestamps: ndarray,
+    offsets: ndarray,
+    t: ndarray | float,
+    linear: bool = False,
+) -> ndarray:
+    # area under the answer trace until time t
+    timestamps = asarray(timestamps, dtype=float64)
+    offsets = asarray(offsets, dtype=int64)
+    lengths, rows, positions = get_segments(offsets)
+    t = broadcast_to(asarray(t, dtype=float64), lengths.shape)
+    if len(timestamps) < 1:
+        return zeros(len(lengths), dtype=float64)
+    mask = timestamps <= t[rows]
+    values = bincount(
+        rows[mask],
+        weights=get_areas(timestamps, positions, linear)[mask],
+        minlength=len(lengths),
+    )
+    # the answers produced by t, and the partial interval after the last of them
+    produced = bincount(rows[mask], minlength=len(lengths))
+    last = where(produced > 0, offsets[:-1] + produced - 1, 0)
+    previous = where(produced > 0, timestamps[last], 0)
+    remaining = (t - previous).clip(min=0)
+    heights = produced.astype(float64)
+    if linear:
+        pending = produced < lengths
+        following = timestamps[where(pending, offsets[:-1] + produced, 0)]
+        spans = where(pending, following - previous, 1)
+        heights += where(pending, 0.5 * remaining / spans, 0)
+    return values + remaining * heights
+
+
+def dief_at_k_single(timestamps: ndarray, linear: bool = False) -> float:
+    return dief_at_k(timestamps, [0, len(timestamps)], linear=linear)[0].item()
@@ -0,0 +1,19 @@
+from pathlib import Path
+from typing import Any, Dict
+from hashlib import file_digest
+
+DEFAULT_ALGORITHM = "blake2b"
+
+
+def get_file_hash(path: Path, algorithm: str = DEFAULT_ALGORITHM) -> str:
+    with open(path, "rb") as fp:
+        return file_digest(fp, algorithm).hexdigest()
+
+
+def is_file_unchanged(
+    path: Path, recorded: Dict[str, Any], size: int, mtime: int
+) -> bool:
+    # a changed mtime alone can be a touch or a copy, so the hash decides
+    if recorded["size"] != size:
+        return False
+    return recorded["mtime"] == mtime or recorded["hash"] == get_file_hash(path)
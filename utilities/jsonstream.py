@@ -0,0 +1,37 @@
+from re import compile
+from typing import Iterator, Tuple, TextIO
+
+CHUNK_SIZE = 1 << 20
+
+STRING = 1
+PUNCTUATION = 2
+SCALAR = 3
+
+# strings, structural characters, and numbers or literals, after any whitespace
+TOKEN_PATTERN = compile(
+    r'\s*(?:("[^"\\]*(?:\\.[^"\\]*)*")|([{}\[\],:])|([^\s"{}\[\],:]+))'
+)
+
+
+def iter_json_tokens(
+    fp: TextIO, chunk_size: int = CHUNK_SIZE
+) -> Iterator[Tuple[int, str]]:
+    # yield (kind, text) tokens of a json document, reading it in chunks
+    buffer = ""
+    position = 0
+    finished = False
+    while True:
+        match = TOKEN_PATTERN.match(buffer, position)
+        # a match at the end of the buffer may still continue in the next chunk
+        if match is None or (match.end() == len(buffer) and not finished):
+            if finished:
+                if buffer[position:].strip():
+                    raise ValueError(f"Invalid JSON: {buffer[position:][:80]}")
+                return
+            chunk = fp.read(chunk_size)
+            finished = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        position = match.end()
+        yield match.lastindex, match.group(match.lastindex)
@@ -0,0 +1,65 @@
+from re import compile, MULTILINE
+from pathlib import Path
+from typing import Iterator, Set, Tuple
+from rdflib import Graph
+
+# the line-based formats that can be read without a full RDF parser
+LINE_FORMATS: Set[str] = set((".nq", ".nt"))
+CHUNK_SIZE = 1 << 20
+
+IRI = r"<[^>]*>"
+BLANK_NODE = r'_:[^\s<"]*[^\s<".]'
+LITERAL = r'"[^"\\]*(?:\\.[^"\\]*)*"(?:@[A-Za-z0-9-]+|\^\^<[^>]*>)?'
+
+# every valid line is matched, either as a statement, a comment or blank space,
+# and the literals are matched as a whole so that quotes, spaces and # inside
+# them do not end the term or start a comment
+LINE_PATTERN = compile(
+    rf"^[ \t]*(?:({IRI}|{BLANK_NODE})[ \t]*({IRI})[ \t]*({IRI}|{BLANK_NODE}|{LITERAL})"
+    rf"[ \t]*(?:({IRI}|{BLANK_NODE})[ \t]*)?\.[ \t]*)?(?:#[^\r\n]*)?\r?$",
+    MULTILINE,
+)
+
+
+def iter_statements(path: Path) -> Iterator[Tuple[str, str, str, str | None]]:
+    # yield n-quads statements as n-triples terms, None for the default graph
+    with open(path, "r", encoding="utf-8") as fp:
+        line_number = 0
+        while True:
+            text = "".join(fp.readlines(CHUNK_SIZE))
+            if not text:
+                break
+            position = 0
+            for match in LINE_PATTERN.finditer(text):
+                # anything between two valid lines can only be an invalid line
+                if match.start() != position:
+                    line_number += text.count("\n", 0, position)
+                    raise ValueError(f"Invalid statement at {path}:{line_number + 1}")
+                position = match.end() + 1
+                if match.lastindex:
+                    yield match.group(1, 2, 3, 4)
+            # an invalid last line without a line break is not followed by a match
+            if position < len(text):
+                line_number += text.count("\n", 0, position)
+                raise ValueError(f"Invalid statement at {path}:{line_number + 1}")
+            line_number += text.count("\n")
+
+
+def count_triples(path: Path) -> int:
+    # count the distinct default graph triples, comparing literals by lexical form
+    triples: Set[Tuple[str, str, str]] = set()
+    for s, p, o, g in iter_statements(path):
+        if g is None:
+            triples.add((s, p, o))
+    return len(triples)
+
+
+def iter_document(path: Path) -> Iterator[Tuple[str, str, str, str | None]]:
+    # iter_statements, with an rdflib fallback for non line-based formats
+    if path.suffix in LINE_FORMATS:
+        yield from iter_statements(path)
+    else:
+        data = Graph()
+        data.parse(path)
+        for s, p, o in data:
+            yield s.n3(), p.n3(), o.n3(), None
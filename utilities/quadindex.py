@@ -0,0 +1,228 @@
+from sqlite3 import connect, Connection
+from pathlib import Path
+from logging import info
+from typing import Dict, Iterable, List, Set, Tuple
+from concurrent.futures import ProcessPoolExecutor
+
+from utilities.nquads import iter_document
+from utilities.sorting import natural_sort_key
+from utilities.walker import (
+    FileEntry,
+    iter_window,
+    list_directories,
+    list_files,
+    shard_files,
+)
+
+INDEX_VERSION = 1
+SHARD_SIZE = 64 * 1024 * 1024
+
+# the terms are stored once in their N-Triples notation and referred to by ID,
+# and the quads of each document are stored without duplicates, with a NULL
+# graph for the default graph and the document they are in for provenance
+SCHEMA: List[str] = [
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS terms (id INTEGER PRIMARY KEY,"
+    " term TEXT UNIQUE NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS pods (id INTEGER PRIMARY KEY,"
+    " name TEXT UNIQUE NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS documents (id INTEGER PRIMARY KEY,"
+    " pod INTEGER NOT NULL REFERENCES pods (id), path TEXT UNIQUE NOT NULL,"
+    " size INTEGER NOT NULL, mtime INTEGER NOT NULL, triples INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS quads (document INTEGER NOT NULL"
+    " REFERENCES documents (id), s INTEGER NOT NULL, p INTEGER NOT NULL,"
+    " o INTEGER NOT NULL, g INTEGER)",
+]
+
+# the indexes are only created after the first bulk load, which is faster
+INDEXES: List[str] = [
+    "CREATE INDEX IF NOT EXISTS quads_spo ON quads (s, p, o)",
+    "CREATE INDEX IF NOT EXISTS quads_pos ON quads (p, o, s)",
+    "CREATE INDEX IF NOT EXISTS quads_osp ON quads (o, s, p)",
+    "CREATE INDEX IF NOT EXISTS quads_document ON quads (document)",
+    "CREATE INDEX IF NOT EXISTS documents_pod ON documents (pod)",
+]
+
+Quad = Tuple[str, str, str, str | None]
+
+
+def open_index(path: Path) -> Connection:
+    connection = connect(path)
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("PRAGMA synchronous = NORMAL")
+    version = None
+    if connection.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'meta'"
+    ).fetchone():
+        version = connection.execute(
+            "SELECT value FROM meta WHERE key = 'version'"
+        ).fetchone()
+    if version is not None and version[0] != str(INDEX_VERSION):
+        info(f"Rebuilding index {path} with an older version {version[0]}")
+        connection.close()
+        path.unlink()
+        connection = connect(path)
+    for statement in SCHEMA:
+        connection.execute(statement)
+    connection.execute(
+        "INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)",
+        (str(INDEX_VERSION),),
+    )
+    connection.commit()
+    return connection
+
+
+def read_index(path: Path) -> Connection:
+    connection = connect(f"{path.absolute().as_uri()}?mode=ro", uri=True)
+    version = connection.execute("SELECT value FROM meta WHERE key = 'version'")
+    if version.fetchone() != (str(INDEX_VERSION),):
+        connection.close()
+        raise ValueError(f"The index {path} has a different version, update it first")
+    return connection
+
+
+def get_pods(connection: Connection) -> List[Tuple[int, str]]:
+    pods = connection.execute("SELECT id, name FROM pods").fetchall()
+    return sorted(pods, key=lambda p: natural_sort_key(p[1]))
+
+
+def get_documents(
+    pods: Path, extensions: Set[str]
+) -> Tuple[List[str], Dict[str, Tuple[str, int, int]]]:
+    # the pods are the directories in the dataset, and documents are relative to it
+    pod_paths = list_directories(pods)
+    documents: Dict[str, Tuple[str, int, int]] = {}
+    for pod in pod_paths:
+        for entry in list_files(pod, extensions):
+            path = Path(entry.path).relative_to(pods).as_posix()
+            documents[path] = (pod.name, entry.size, entry.mtime)
+    return [pod.name for pod in pod_paths], documents
+
+
+def read_document(path: Path) -> Tuple[List[Quad], int]:
+    quads = list(set(iter_document(path)))
+    return quads, sum(1 for q in quads if q[3] is None)
+
+
+def read_documents(paths: List[Path]) -> List[Tuple[List[Quad], int]]:
+    return [read_document(path) for path in paths]
+
+
+class TermDictionary:
+    # term ids of an index, with the terms added since the last flush
+    def __init__(self, connection: Connection) -> None:
+        self.ids: Dict[str, int] = dict(
+            connection.execute("SELECT term, id FROM terms")
+        )
+        self.next_id = max(self.ids.values(), default=0) + 1
+        self.pending: List[Tuple[int, str]] = []
+
+    def get_id(self, term: str) -> int:
+        term_id = self.ids.get(term)
+        if term_id is None:
+            term_id = self.next_id
+            self.next_id += 1
+            self.ids[term] = term_id
+            self.pending.append((term_id, term))
+        return term_id
+
+    def flush(self, connection: Connection) -> None:
+        connection.executemany(
+            "INSERT INTO terms (id, term) VALUES (?, ?)", self.pending
+        )
+        self.pending.clear()
+
+
+def write_documents(
+    connection: Connection,
+    documents: List[Tuple[str, int, int, int]],
+    results: Iterable[Tuple[List[Quad], int]],
+) -> None:
+    terms = TermDictionary(connection)
+    for (path, pod_id, size, mtime), (quads, triples) in zip(documents, results):
+        document_id = connection.execute(
+            "INSERT INTO documents (pod, path, size, mtime, triples)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (pod_id, path, size, mtime, triples),
+        ).lastrowid
+        rows = [
+            (
+                document_id,
+                terms.get_id(s),
+                terms.get_id(p),
+                terms.get_id(o),
+                None if g is None else terms.get_id(g),
+            )
+            for s, p, o, g in quads
+        ]
+        terms.flush(connection)
+        connection.executemany("INSERT INTO quads VALUES (?, ?, ?, ?, ?)", rows)
+
+
+def update_index(
+    connection: Connection, pods: Path, extensions: Set[str], workers: int = 1
+) -> None:
+    # index only the documents that are new or changed since the last update
+    pod_names, documents = get_documents(pods, extensions)
+    indexed: Dict[str, Tuple[int, int, int]] = dict(
+        (path, (document_id, size, mtime))
+        for document_id, path, size, mtime in connection.execute(
+            "SELECT id, path, size, mtime FROM documents"
+        )
+    )
+    stale = set(
+        path
+        for path, (_, size, mtime) in indexed.items()
+        if path not in documents or documents[path][1:] != (size, mtime)
+    )
+    pending = sorted(p for p in documents if p not in indexed or p in stale)
+    info(
+        f"Indexing {len(pending)} of {len(documents)} documents,"
+        f" with {len(stale)} changed or removed since the last update"
+    )
+
+    for path in stale:
+        document_id = indexed[path][0]
+        connection.execute("DELETE FROM quads WHERE document = ?", (document_id,))
+        connection.execute("DELETE FROM documents WHERE id = ?", (document_id,))
+    indexed_pods = set(name for (name,) in connection.execute("SELECT name FROM pods"))
+    connection.executemany(
+        "DELETE FROM pods WHERE name = ?",
+        ((name,) for name in indexed_pods.difference(pod_names)),
+    )
+    connection.executemany(
+        "INSERT OR IGNORE INTO pods (name) VALUES (?)", ((n,) for n in pod_names)
+    )
+    pod_ids: Dict[str, int] = dict(connection.execute("SELECT name, id FROM pods"))
+
+    entries = [FileEntry(p, *documents[p][1:]) for p in pending]
+    workers = min(workers, len(entries))
+    if workers < 2:
+        shards = [entries]
+    else:
+        # shards of similar size keep the workers busy until the end, and at most
+        # SHARD_SIZE on average bound the size of the results of each shard
+        total_size = sum(entry.size for entry in entries)
+        shards = shard_files(entries, max(workers * 4, -(-total_size // SHARD_SIZE)))
+    rows = [
+        (entry.path, pod_ids[documents[entry.path][0]], entry.size, entry.mtime)
+        for shard in shards
+        for entry in shard
+    ]
+    paths = [[pods.joinpath(entry.path) for entry in shard] for shard in shards]
+    if workers < 2:
+        write_documents(connection, rows, map(read_document, paths[0]))
+    else:
+        # the documents are parsed in the pool and written to the index in order
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # at most two shards per worker are read ahead of the writer
+            results = iter_window(
+                executor, read_documents, ((shard,) for shard in paths), 2 * workers
+            )
+            write_documents(connection, rows, (r for shard in results for r in shard))
+
+    for statement in INDEXES:
+        connection.execute(statement)
+    connection.commit()
+    connection.execute("ANALYZE")
+    info(f"Indexed {len(documents)} documents in {len(pod_names)} pods")
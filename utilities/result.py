@@ -1,98 +1,349 @@
-from os import scandir
-from csv import DictReader
-from typing import List, Dict
+from os import scandir, replace, stat_result
+from uuid import uuid4
+from json import dumps, loads
+from typing import List, Dict, Tuple, Iterable, Iterator, Any
 from pathlib import Path
+from logging import debug, warning
+from concurrent.futures import ProcessPoolExecutor
+from numpy import ndarray, array, asarray, concatenate, cumsum, full, float64, int64
+from numpy import fromstring, load, save
 
+from utilities.diefficiency import dief_at_k_single
+from utilities.sorting import natural_sort_key
+from utilities.hashing import get_file_hash, is_file_unchanged
 
 TIME_DIVISOR = 1000
 LIST_SEPARATOR = " "
 COLUMN_SEPARATOR = ";"
 
+# below this total file size, the overhead of a process pool is not worth it
+PARALLEL_MIN_SIZE = 8 * 1024 * 1024
+
+# CSV column names mapped to the table column names
+STRING_COLUMNS: Dict[str, str] = {"name": "name", "id": "id"}
+INTEGER_COLUMNS: Dict[str, str] = {
+    "results": "results",
+    "resultsMin": "results_min",
+    "resultsMax": "results_max",
+    "httpRequests": "http_requests",
+    "httpRequestsMin": "http_requests_min",
+    "httpRequestsMax": "http_requests_max",
+}
+TIME_COLUMNS: Dict[str, str] = {
+    "time": "time",
+    "timeMin": "time_min",
+    "timeMax": "time_max",
+}
+TIMESTAMP_COLUMNS: Dict[str, str] = {
+    "timestamps": "timestamps",
+    "timestampsMin": "timestamps_min",
+    "timestampsMax": "timestamps_max",
+}
+OFFSETS_SUFFIX = "_offsets"
+
+# the parsed columns are cached as uncompressed arrays in a sidecar directory next
+# to each CSV file, so that they can be memory mapped instead of read and copied
+CACHE_VERSION = 2
+CACHE_KEY_NAME = "key.json"
+
+
+class ResultTable:
+    # columnar results, timestamps of row i are buffer[offsets[i]:offsets[i + 1]]
+    columns: Dict[str, ndarray]
+
+    def __init__(self, columns: Dict[str, ndarray]) -> None:
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return len(self.columns["experiment"])
+
+    def __getitem__(self, index: int) -> "Result":
+        if index < 0 or index >= len(self):
+            raise IndexError(f"Result index {index} out of range")
+        return Result(self, index)
+
+    def __iter__(self) -> Iterator["Result"]:
+        for index in range(0, len(self)):
+            yield Result(self, index)
+
+    def offsets(self, column: str) -> ndarray:
+        return self.columns[column + OFFSETS_SUFFIX]
+
+    def row_timestamps(self, column: str, index: int) -> ndarray:
+        offsets = self.offsets(column)
+        start, end = offsets[index], offsets[index + 1]
+        return self.columns[column][start:end]
+
+    def value(self, column: str, index: int) -> Any:
+        if column in TIMESTAMP_COLUMNS.values():
+            return self.row_timestamps(column, index)
+        return self.columns[column][index].item()
+
+    def select(self, indices: Iterable[int]) -> "ResultTable":
+        # the rows are copied into a new table, with their timestamps made contiguous
+        rows = asarray(list(indices), dtype=int64)
+        columns: Dict[str, ndarray] = {}
+        for column, values in self.columns.items():
+            if column in TIMESTAMP_COLUMNS.values():
+                parts = [self.row_timestamps(column, i) for i in rows]
+                columns[column] = concatenate([array([], dtype=float64), *parts])
+                columns[column + OFFSETS_SUFFIX] = cumsum(
+                    [0, *(len(t) for t in parts)], dtype=int64
+                )
+            elif not column.endswith(OFFSETS_SUFFIX):
+                columns[column] = values[rows]
+        return ResultTable(columns)
+
+    @staticmethod
+    def from_rows(
+        experiment: str,
+        header: List[str],
+        rows: Iterable[List[str]],
+    ) -> "ResultTable":
+        # the column positions are only looked up once for all the rows
+        positions = {column: i for i, column in enumerate(header)}
+        values: Dict[str, List[Any]] = {"error": []}
+        fields: Dict[str, int | None] = {}
+        for key, column in (
+            *STRING_COLUMNS.items(),
+            *INTEGER_COLUMNS.items(),
+            *TIME_COLUMNS.items(),
+            *TIMESTAMP_COLUMNS.items(),
+        ):
+            values[column] = []
+            fields[column] = positions.get(key)
+        error_field = positions["error"]
+        for row in rows:
+            values["error"].append(row[error_field] == "true")
+            for column in STRING_COLUMNS.values():
+                values[column].append(row[fields[column]])
+            for column in (*INTEGER_COLUMNS.values(), *TIME_COLUMNS.values()):
+                values[column].append(get_field(row, fields[column]) or 0)
+            for column in TIMESTAMP_COLUMNS.values():
+                values[column].append(parse_timestamps(get_field(row, fields[column])))
+        columns: Dict[str, ndarray] = {
+            "experiment": full(len(values["error"]), experiment),
+            "error": array(values["error"], dtype=bool),
+        }
+        for column in STRING_COLUMNS.values():
+            columns[column] = array(values[column], dtype=str)
+        for column in INTEGER_COLUMNS.values():
+            columns[column] = array(values[column], dtype=float64).round().astype(int64)
+        for column in TIME_COLUMNS.values():
+            columns[column] = array(values[column], dtype=float64) / TIME_DIVISOR
+        for column in TIMESTAMP_COLUMNS.values():
+            columns[column] = concatenate([array([], dtype=float64), *values[column]])
+            columns[column + OFFSETS_SUFFIX] = cumsum(
+                [0, *(len(t) for t in values[column])], dtype=int64
+            )
+        return ResultTable(columns)
+
+    @staticmethod
+    def concatenate(tables: Iterable["ResultTable"]) -> "ResultTable":
+        tables = list(tables)
+        tables = [t for t in tables if len(t)] or tables[:1]
+        if not tables:
+            return ResultTable.from_rows("", ["error", *STRING_COLUMNS], [])
+        columns: Dict[str, ndarray] = {}
+        for column in tables[0].columns:
+            if column.endswith(OFFSETS_SUFFIX):
+                offsets: List[ndarray] = [asarray([0], dtype=int64)]
+                for table in tables:
+                    offsets.append(table.columns[column][1:] + offsets[-1][-1])
+                columns[column] = concatenate(offsets)
+            else:
+                columns[column] = concatenate([t.columns[column] for t in tables])
+        return ResultTable(columns)
+
+
+def column_property(column: str) -> property:
+    return property(lambda self: self.table.value(column, self.index))
+
 
 class Result:
-    name: str
-    id: str
-    experiment: str
-    results: int
-    results_min: int
-    results_max: int
-    time: float
-    time_min: float
-    time_max: float
-    error: bool
-    timestamps: List[float]
-    timestamps_max: List[float]
-    timestamps_min: List[float]
-    http_requests: int
-    http_requests_min: int
-    http_requests_max: int
-
-    def __init__(self, experiment: str, row: Dict[str, str | int | float]) -> None:
-        # helper functions
-        get_float = lambda k: float(row[k]) if len(row.get(k, "")) else 0
-        get_ts_values = lambda k: (
-            sorted(float(t) / TIME_DIVISOR for t in row[k].split(LIST_SEPARATOR))
-            if len(row.get(k, ""))
-            else []
-        )
-        # actually assigning the data
-        self.experiment = experiment
-        self.name = row["name"]
-        self.id = row["id"]
-        self.results = round(get_float("results"))
-        self.results_min = round(get_float("resultsMin"))
-        self.results_max = round(get_float("resultsMax"))
-        self.time = get_float("time") / TIME_DIVISOR
-        self.time_min = get_float("timeMin") / TIME_DIVISOR
-        self.time_max = get_float("timeMax") / TIME_DIVISOR
-        self.error = row["error"] == "true"
-        self.timestamps = get_ts_values("timestamps")
-        self.timestamps_min = get_ts_values("timestampsMin")
-        self.timestamps_max = get_ts_values("timestampsMax")
-        self.http_requests = round(get_float("httpRequests"))
-        self.http_requests_min = round(get_float("httpRequestsMin"))
-        self.http_requests_max = round(get_float("httpRequestsMax"))
+    # view of one row of a ResultTable
+    table: ResultTable
+    index: int
+
+    experiment: str = column_property("experiment")
+    name: str = column_property("name")
+    id: str = column_property("id")
+    results: int = column_property("results")
+    results_min: int = column_property("results_min")
+    results_max: int = column_property("results_max")
+    time: float = column_property("time")
+    time_min: float = column_property("time_min")
+    time_max: float = column_property("time_max")
+    error: bool = column_property("error")
+    timestamps: ndarray = column_property("timestamps")
+    timestamps_min: ndarray = column_property("timestamps_min")
+    timestamps_max: ndarray = column_property("timestamps_max")
+    http_requests: int = column_property("http_requests")
+    http_requests_min: int = column_property("http_requests_min")
+    http_requests_max: int = column_property("http_requests_max")
+
+    def __init__(self, table: ResultTable, index: int) -> None:
+        self.table = table
+        self.index = index
 
     def diefficiency(self, linear: bool = False) -> float:
-        previous_timestamp = 0
-        diefficiency_total = 0
-        result_count = 0
-        for t in self.timestamps:
-            x = t - previous_timestamp
-            y = result_count + (0.5 if linear else 0)
-            diefficiency_total += x * y
-            previous_timestamp = t
-            result_count += 1
-        return diefficiency_total
+        return dief_at_k_single(self.timestamps, linear=linear)
 
     def query(self) -> str:
         return f"{self.name}-{self.id}"
 
 
-def load_results_from_file(experiment: str, path: Path) -> List[Result]:
-    results: List[Result] = []
+def get_field(row: List[str], position: int | None) -> str:
+    return row[position] if position is not None and position < len(row) else ""
+
+
+def parse_timestamps(field: str) -> ndarray:
+    # the whole field is converted at once, and only sorted when out of order
+    if "." in field or "e" in field:
+        timestamps = fromstring(field, dtype=float64, sep=LIST_SEPARATOR)
+    else:
+        # the runner writes integers, which are much faster to convert as such
+        timestamps = fromstring(field, dtype=int64, sep=LIST_SEPARATOR)
+        timestamps = timestamps.astype(float64)
+    if len(timestamps) > 1 and (timestamps[1:] < timestamps[:-1]).any():
+        timestamps.sort()
+    timestamps /= TIME_DIVISOR
+    return timestamps
+
+
+def get_cache_path(path: Path) -> Path:
+    return path.with_name(f".{path.name}.cache")
+
+
+def get_cache_key(path: Path, stats: stat_result, digest: str | None) -> Dict[str, Any]:
+    return {
+        "version": CACHE_VERSION,
+        "path": path.absolute().as_posix(),
+        "size": stats.st_size,
+        "mtime": stats.st_mtime_ns,
+        "hash": digest,
+    }
+
+
+def save_cached_results(path: Path, table: ResultTable, digest: str) -> None:
+    cache_path = get_cache_path(path)
+    cache_key = get_cache_key(path, path.stat(), digest)
+    columns = {k: v for k, v in table.columns.items() if k != "experiment"}
+    # every write has its own column files, and the key that names them is
+    # replaced last, so a reader never sees the columns of two different writes
+    token = uuid4().hex
+    try:
+        cache_path.mkdir(exist_ok=True)
+        for column, values in columns.items():
+            save(cache_path.joinpath(f"{column}.{token}.npy"), values)
+        temporary_path = cache_path.joinpath(f"{CACHE_KEY_NAME}.{token}.tmp")
+        temporary_path.write_text(
+            dumps({"key": cache_key, "token": token, "columns": list(columns)})
+        )
+        replace(temporary_path, cache_path.joinpath(CACHE_KEY_NAME))
+    except OSError as ex:
+        warning(f"Unable to write cache {cache_path}: {ex}")
+        return
+    # the columns of earlier writes stay readable through any open memory maps
+    for fp in scandir(cache_path):
+        if fp.name != CACHE_KEY_NAME and f".{token}." not in fp.name:
+            try:
+                Path(fp.path).unlink()
+            except OSError as ex:
+                debug(f"Unable to remove {fp.path}: {ex}")
+
+
+def load_cached_results(experiment: str, path: Path) -> ResultTable | None:
+    cache_path = get_cache_path(path)
+    key_path = cache_path.joinpath(CACHE_KEY_NAME)
+    if not key_path.is_file():
+        return None
+    try:
+        cache: Dict[str, Any] = loads(key_path.read_text())
+        cache_key: Dict[str, Any] = cache["key"]
+        stats = path.stat()
+        current_key = get_cache_key(path, stats, cache_key["hash"])
+        # the same version and path, and a file that has not changed since
+        same_source = cache_key == {**current_key, "mtime": cache_key["mtime"]}
+        if not (
+            same_source
+            and is_file_unchanged(path, cache_key, stats.st_size, stats.st_mtime_ns)
+        ):
+            debug(f"Invalidating stale cache {cache_path}")
+            return None
+        columns = {
+            column: load(
+                cache_path.joinpath(f"{column}.{cache['token']}.npy"), mmap_mode="r"
+            )
+            for column in cache["columns"]
+        }
+    except Exception as ex:
+        debug(f"Unable to read cache {cache_path}: {ex}")
+        return None
+    columns["experiment"] = full(len(columns["error"]), experiment)
+    table = ResultTable(columns)
+    if cache_key != current_key:
+        save_cached_results(path, table, cache_key["hash"])
+    return table
+
+
+def load_results_from_file(
+    experiment: str,
+    path: Path,
+    cache: bool = False,
+) -> ResultTable:
     with open(path, "r") as result_file:
-        reader = DictReader(result_file, delimiter=COLUMN_SEPARATOR)
-        for row in reader:
-            results.append(Result(experiment, row))
-    return results
+        header = result_file.readline().rstrip("\r\n").split(COLUMN_SEPARATOR)
+        table = ResultTable.from_rows(
+            experiment,
+            header,
+            (
+                line.rstrip("\r\n").split(COLUMN_SEPARATOR)
+                for line in result_file
+                if not line.isspace()
+            ),
+        )
+    if cache:
+        save_cached_results(path, table, get_file_hash(path))
+    return table
 
 
 def load_results(
     path: Path,
     subpath: List[str] = ["output", "query-times.csv"],
-) -> List[Result]:
-    results: List[Result] = []
+    workers: int = 1,
+    cache: bool = True,
+) -> ResultTable:
+    experiments: List[Tuple[str, Path]] = []
     for fp in scandir(path):
         if fp.is_dir():
-            experiment = fp.name
             result_path = path.joinpath(fp.name, *subpath)
             if result_path.is_file():
-                results.extend(load_results_from_file(experiment, result_path))
-    return results
+                experiments.append((fp.name, result_path))
+    # the experiments are merged in a fixed order regardless of the worker count
+    experiments.sort(key=lambda e: natural_sort_key(e[0]))
+    tables: List[ResultTable | None] = [
+        load_cached_results(e, p) if cache else None for e, p in experiments
+    ]
+    pending = [experiments[i] for i, t in enumerate(tables) if t is None]
+    debug(f"Loaded {len(experiments) - len(pending)} experiments from cache")
+    total_size = sum(p.stat().st_size for _, p in pending)
+    workers = min(workers, len(pending))
+    if workers < 2 or total_size < PARALLEL_MIN_SIZE:
+        parsed = [load_results_from_file(e, p, cache) for e, p in pending]
+    else:
+        debug(f"Loading {len(pending)} experiments using {workers} workers")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parsed = list(
+                executor.map(
+                    load_results_from_file, *zip(*pending), [cache] * len(pending)
+                )
+            )
+    parsed.reverse()
+    return ResultTable.concatenate(t if t is not None else parsed.pop() for t in tables)
 
 
-def group_by_query(results: List[Result]) -> Dict[str, List[Result]]:
+def group_by_query(results: Iterable[Result]) -> Dict[str, List[Result]]:
     results_by_query: Dict[str, List[Result]] = {}
     for result in results:
         if result.query() not in results_by_query:
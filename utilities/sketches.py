@@ -0,0 +1,107 @@
+from math import ceil, log, log2
+from hashlib import blake2b
+from typing import Dict, Iterable, List, Set, Tuple
+
+MIN_PRECISION = 4
+MAX_PRECISION = 18
+
+
+def get_hash(value: str) -> int:
+    return int.from_bytes(blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    # mergeable distinct count estimate, error about 1.04 / sqrt(2^precision)
+    precision: int
+    registers: bytearray
+
+    def __init__(self, precision: int) -> None:
+        self.precision = min(max(precision, MIN_PRECISION), MAX_PRECISION)
+        self.registers = bytearray(1 << self.precision)
+
+    @staticmethod
+    def from_error(error: float) -> "HyperLogLog":
+        return HyperLogLog(ceil(2 * log2(1.04 / error)))
+
+    def update(self, values: Iterable[str]) -> None:
+        registers = self.registers
+        shift = 64 - self.precision
+        mask = (1 << shift) - 1
+        for value in values:
+            value_hash = get_hash(value)
+            # the register from the leading bits, and the rank from the rest
+            index = value_hash >> shift
+            rank = shift - (value_hash & mask).bit_length() + 1
+            if rank > registers[index]:
+                registers[index] = rank
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        assert self.precision == other.precision, "Cannot merge different precisions"
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self) -> int:
+        size = len(self.registers)
+        if size >= 128:
+            alpha = 0.7213 / (1 + 1.079 / size)
+        else:
+            alpha = {16: 0.673, 32: 0.697, 64: 0.709}[size]
+        estimate = alpha * size * size / sum(2.0**-r for r in self.registers)
+        # linear counting is more accurate while many registers are still empty
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * size and zeros > 0:
+            estimate = size * log(size / zeros)
+        return round(estimate)
+
+
+class ExactSet:
+    # exact distinct count with the HyperLogLog interface
+    values: Set[str]
+
+    def __init__(self) -> None:
+        self.values = set()
+
+    def update(self, values: Iterable[str]) -> None:
+        self.values.update(values)
+
+    def merge(self, other: "ExactSet") -> "ExactSet":
+        self.values.update(other.values)
+        return self
+
+    def count(self) -> int:
+        return len(self.values)
+
+
+def get_distinct_counter(error: float, exact: bool) -> HyperLogLog | ExactSet:
+    return ExactSet() if exact else HyperLogLog.from_error(error)
+
+
+class SpaceSaving:
+    # mergeable heavy hitters, exact without a capacity
+    capacity: int | None
+    counts: Dict[str, int]
+
+    def __init__(self, capacity: int | None) -> None:
+        self.capacity = capacity
+        self.counts = {}
+
+    def update(self, counts: Dict[str, int]) -> None:
+        for item, count in counts.items():
+            if item in self.counts or self.capacity is None:
+                self.counts[item] = self.counts.get(item, 0) + count
+            elif len(self.counts) < self.capacity:
+                self.counts[item] = count
+            else:
+                # the new item takes over the smallest counter and its count
+                smallest = min(self.counts, key=self.counts.__getitem__)
+                self.counts[item] = self.counts.pop(smallest) + count
+
+    def merge(self, other: "SpaceSaving") -> "SpaceSaving":
+        for item, count in other.counts.items():
+            self.counts[item] = self.counts.get(item, 0) + count
+        if self.capacity is not None and len(self.counts) > self.capacity:
+            self.counts = dict(self.top(self.capacity))
+        return self
+
+    def top(self, k: int) -> List[Tuple[str, int]]:
+        return sorted(self.counts.items(), key=lambda i: (-i[1], i[0]))[:k]
@@ -0,0 +1,80 @@
+from os import scandir
+from heapq import heapify, heapreplace
+from pathlib import Path
+from logging import debug
+from typing import Any, Callable, Deque, Iterable, Iterator, List, NamedTuple, Tuple
+from collections import deque
+from concurrent.futures import Executor, Future
+
+from utilities.sorting import natural_sort_key
+
+
+class FileEntry(NamedTuple):
+    path: str
+    size: int
+    mtime: int
+
+
+def walk_files(
+    path: Path, extensions: Iterable[str] | None = None
+) -> Iterator[List[FileEntry]]:
+    # yield the files of each directory as a batch, stat only for the kept ones
+    suffixes = None if extensions is None else tuple(extensions)
+    stack: List[str] = [path.as_posix()]
+    while stack:
+        batch: List[FileEntry] = []
+        with scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    stack.append(entry.path)
+                elif entry.is_file() and (
+                    suffixes is None or entry.name.endswith(suffixes)
+                ):
+                    stats = entry.stat()
+                    batch.append(
+                        FileEntry(entry.path, stats.st_size, stats.st_mtime_ns)
+                    )
+                else:
+                    debug(f"Skipping: {entry.path}")
+        if batch:
+            yield batch
+
+
+def list_files(path: Path, extensions: Iterable[str] | None = None) -> List[FileEntry]:
+    return [entry for batch in walk_files(path, extensions) for entry in batch]
+
+
+def list_directories(path: Path) -> List[Path]:
+    # the directories directly in path, such as the pods of a dataset, in natural order
+    with scandir(path) as entries:
+        names = [entry.name for entry in entries if entry.is_dir()]
+    return [path.joinpath(name) for name in sorted(names, key=natural_sort_key)]
+
+
+def shard_files(files: Iterable[FileEntry], shards: int) -> List[List[FileEntry]]:
+    # split files into shards of roughly equal size, largest file first
+    ordered = sorted(files, key=lambda f: (-f.size, f.path))
+    output: List[List[FileEntry]] = [[] for _ in range(min(shards, len(ordered)))]
+    heap: List[Tuple[int, int]] = [(0, i) for i in range(len(output))]
+    heapify(heap)
+    for entry in ordered:
+        size, index = heap[0]
+        output[index].append(entry)
+        heapreplace(heap, (size + entry.size, index))
+    return output
+
+
+def iter_window(
+    executor: Executor,
+    function: Callable[..., Any],
+    arguments: Iterable[Tuple],
+    window: int,
+) -> Iterator[Any]:
+    # the results in order, with at most window calls submitted ahead of them
+    futures: Deque[Future] = deque()
+    for call_arguments in arguments:
+        futures.append(executor.submit(function, *call_arguments))
+        if len(futures) >= window:
+            yield futures.popleft().result()
+    while futures:
+        yield futures.popleft().result()